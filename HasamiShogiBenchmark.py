@@ -0,0 +1,251 @@
+# Description: Benchmarks for the move and capture code of HasamiShogiGame and a perft move counter. Every workload is
+# a fixed set of positions and moves, so runs on different builds can be compared. Results are printed as JSON. Run
+# "python HasamiShogiBenchmark.py --help" for the options. On other board sizes only the replay and perft workloads
+# run, since the fixed positions are laid out for 9x9, which gives a per-move cost to compare against the 9x9 one.
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+from HasamiShogiBoardGame import HasamiShogiGame, _TABLES, _build_position
+
+# Known perft counts from the 9x9 starting position, used to flag a move generator or capture rule that has changed
+_PERFT_COUNTS = {1: 63, 2: 3717, 3: 254219}
+
+_REPLAY_SEED = 2021
+_REPLAY_PLIES = 300
+
+
+def _position(black, red, turn="BLACK"):
+    """
+    This function builds a position for _set_position from space-separated square lists such as "e1 e7".
+    """
+    black_mask = 0
+    red_mask = 0
+    for square in black.split():
+        black_mask |= 1 << _TABLES.indexes[square]
+    for square in red.split():
+        red_mask |= 1 << _TABLES.indexes[square]
+    return _build_position(black_mask, red_mask, turn)
+
+
+def _start():
+    """
+    This function returns the starting position.
+    """
+    return HasamiShogiGame(bitboard=True)._get_position()
+
+
+# Each workload is a list of (position, start, end, pieces the move should capture)
+_CASES = {
+    "quiet": [(_start(), "i1", "e1", 0), (_start(), "i5", "c5", 0), (_start(), "i9", "b9", 0),
+              (_position("i1 i2 i3 i4 i5 i6 i7 i8 i9 e5", "a1 a2 a3 a4 a5 a6 a7 a8 a9 d1", "RED"), "d1", "d4", 0)],
+    "capture_up": [(_position("c5 e8", "d5"), "e8", "e5", 1)],
+    "capture_down": [(_position("g5 e8", "f5"), "e8", "e5", 1)],
+    "capture_left": [(_position("e3 h5", "e4"), "h5", "e5", 1)],
+    "capture_right": [(_position("e7 h5", "e6"), "h5", "e5", 1)],
+    "capture_multi": [(_position("e1 c5 h5", "e2 e3 e4 d5"), "h5", "e5", 4),
+                      (_position("e1 i8", "e2 e3 e4 e5 e6 e7"), "i8", "e8", 6),
+                      (_position("c5 e3 e7 i5", "d5 e4 e6"), "i5", "e5", 3)],
+    "corner_a1": [(_position("b1 a5", "a1"), "a5", "a2", 1)],
+    "corner_a9": [(_position("a8 e9", "a9"), "e9", "b9", 1)],
+    "corner_i1": [(_position("h1 i6", "i1"), "i6", "i2", 1)],
+    "corner_i9": [(_position("i8 d9", "i9"), "d9", "h9", 1)],
+}
+
+
+def _replay_moves(size=_TABLES.size):
+    """
+    This function plays a fixed game of random legal moves on a SIZE by SIZE board and returns its moves. The same
+    seed always gives the same game, so every build replays identical moves.
+    """
+    game = HasamiShogiGame(True, size)
+    rng = random.Random(_REPLAY_SEED)
+    moves = []
+    while len(moves) < _REPLAY_PLIES:
+        choices = list(game.legal_moves(game.get_active_player()))
+        if not choices:
+            break
+        move = rng.choice(choices)
+        game.make_move(*move)
+        moves.append(move)
+    return moves
+
+
+def _check_cases(bitboard):
+    """
+    This function plays every case once and returns the names of the workloads where a move was refused or captured
+    the wrong number of pieces.
+    """
+    failed = []
+    game = HasamiShogiGame(bitboard)
+    for name, cases in _CASES.items():
+        for position, start, end, expected in cases:
+            game._set_position(position)
+            before = game.get_num_captured_pieces("RED") + game.get_num_captured_pieces("BLACK")
+            moved = game.make_move(start, end)
+            after = game.get_num_captured_pieces("RED") + game.get_num_captured_pieces("BLACK")
+            if not moved or after - before != expected:
+                failed.append(name)
+                break
+    return failed
+
+
+def _time_cases(game, cases, ops):
+    """
+    This function times OPS moves cycling through CASES. Each op puts the case's position back and then calls
+    make_move, so the time includes the reset measured by _time_reset.
+    """
+    work = [cases[number % len(cases)][:3] for number in range(ops)]
+    set_position = game._set_position
+    make_move = game.make_move
+    started = time.perf_counter()
+    for position, start, end in work:
+        set_position(position)
+        make_move(start, end)
+    return time.perf_counter() - started
+
+
+def _time_reset(game, cases, ops):
+    """
+    This function times only putting the positions of CASES back, the part of _time_cases that isn't the move.
+    """
+    work = [cases[number % len(cases)][0] for number in range(ops)]
+    set_position = game._set_position
+    started = time.perf_counter()
+    for position in work:
+        set_position(position)
+    return time.perf_counter() - started
+
+
+def _time_replay(bitboard, moves, ops, validate, size=_TABLES.size):
+    """
+    This function replays the fixed game from the start until about OPS moves have been made, with make_move when
+    VALIDATE is true and with the trusted apply_moves path otherwise. It returns the time and the moves made.
+    """
+    games = max(1, ops // len(moves))
+    started = time.perf_counter()
+    for _ in range(games):
+        game = HasamiShogiGame(bitboard, size)
+        if validate:
+            make_move = game.make_move
+            for start, end in moves:
+                make_move(start, end)
+        else:
+            game.apply_moves(moves, validate=False)
+    return time.perf_counter() - started, games * len(moves)
+
+
+def perft(game, depth):
+    """
+    This function counts the positions reached from GAME after exactly DEPTH moves, trying each move with _push and
+    taking it back with pop_move. As in standard perft, a game that is won before the last move has no moves left and
+    adds nothing, while a game won by the last move is counted like any other leaf.
+    """
+    if depth == 0:
+        return 1
+    moves = list(game._generate_moves(game.get_active_player()))
+    if depth == 1:
+        return len(moves)
+
+    nodes = 0
+    for start, end in moves:
+        game._push(start, end)
+        nodes += perft(game, depth - 1)
+        game.pop_move()
+    return nodes
+
+
+def _result(ops, seconds, reset_seconds=None):
+    """
+    This function builds the JSON entry for one workload. When the RESET_SECONDS spent putting positions back is
+    given, the time per move without it is included as well.
+    """
+    result = {"ops": ops, "seconds": round(seconds, 6),
+              "ops_per_second": round(ops / seconds, 1) if seconds > 0 else 0.0}
+    if reset_seconds is not None:
+        result["move_ns"] = round(max(0.0, seconds - reset_seconds) / ops * 1e9, 1)
+    return result
+
+
+def run_benchmarks(backend="bit", ops=20000, repeat=3, perft_depth=3, only=None, size=_TABLES.size):
+    """
+    This function runs every workload (or the ones named in ONLY) on the "list" or "bit" BACKEND and returns the
+    results as a dictionary. Each workload runs OPS moves REPEAT times and the fastest run is kept. Move workloads
+    also report "move_ns", the time per move with the cost of resetting the position taken out. On a SIZE other
+    than 9 the fixed-position workloads are skipped.
+    """
+    bitboard = backend == "bit"
+    standard = size == _TABLES.size
+    game = HasamiShogiGame(bitboard)
+    moves = _replay_moves(size)
+    results = {}
+
+    def wanted(name):
+        return only is None or name in only
+
+    for name, cases in _CASES.items():
+        if standard and wanted(name):
+            reset_seconds = min(_time_reset(game, cases, ops) for _ in range(repeat))
+            results[name] = _result(ops, min(_time_cases(game, cases, ops) for _ in range(repeat)), reset_seconds)
+    for name, validate in (("replay", True), ("replay_trusted", False)):
+        if wanted(name):
+            runs = [_time_replay(bitboard, moves, ops, validate, size) for _ in range(repeat)]
+            results[name] = _result(runs[0][1], min(seconds for seconds, _ in runs))
+
+    report = {"backend": backend, "board_size": size, "python": platform.python_version(), "ops": ops,
+              "repeat": repeat, "replay_plies": len(moves), "failed_checks": _check_cases(bitboard) if standard else [],
+              "results": results}
+
+    if perft_depth and wanted("perft"):
+        game = HasamiShogiGame(bitboard, size)
+        started = time.perf_counter()
+        nodes = perft(game, perft_depth)
+        seconds = time.perf_counter() - started
+        report["perft"] = {"depth": perft_depth, "nodes": nodes, "seconds": round(seconds, 6),
+                           "nodes_per_second": round(nodes / seconds, 1) if seconds > 0 else 0.0,
+                           "expected": _PERFT_COUNTS.get(perft_depth) if standard else None}
+    return report
+
+
+def main(argv=None):
+    """
+    This function is the command-line entry point.
+    """
+    workloads = list(_CASES) + ["replay", "replay_trusted", "perft"]
+    parser = argparse.ArgumentParser(description="Benchmark HasamiShogiGame moves and captures and print JSON.")
+    parser.add_argument("--backend", choices=("list", "bit", "both"), default="both")
+    parser.add_argument("--ops", type=int, default=20000, help="moves per workload run")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per workload; the fastest is kept")
+    parser.add_argument("--perft-depth", type=int, default=3, help="perft depth, or 0 to skip it")
+    parser.add_argument("--only", nargs="+", choices=workloads, help="run just these workloads")
+    parser.add_argument("--output", default="-", help="file to write the JSON to, or - for standard output")
+    parser.add_argument("--board-size", type=int, default=_TABLES.size,
+                        help="rows and columns; sizes other than 9 run only the replay and perft workloads")
+    args = parser.parse_args(argv)
+    if not 4 <= args.board_size <= 26:
+        parser.error("--board-size must be from 4 to 26")
+
+    backends = ("list", "bit") if args.backend == "both" else (args.backend,)
+    reports = [run_benchmarks(backend, max(1, args.ops), max(1, args.repeat), args.perft_depth, args.only,
+                              args.board_size)
+               for backend in backends]
+    text = json.dumps(reports if len(reports) > 1 else reports[0], indent=2)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+
+    # Exits with an error when a workload stopped doing what it is meant to, so a build script can catch it
+    for report in reports:
+        perft_report = report.get("perft")
+        if report["failed_checks"] or (perft_report and perft_report["expected"] not in (None, perft_report["nodes"])):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
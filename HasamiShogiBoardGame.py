@@ -3,6 +3,19 @@
 # Description: This code simulates a Hasami Shogi board game with movable pieces and features player turns that are
 # kept track of with movement checks and capture/win detection. Good luck!
 
+import random
+import time
+
+_BOARD_SIZE = 9
+
+# Names used by the make_move instrumentation for its timed phases, capture scans (also by the list board's row and
+# column steps) and rejected moves
+_CAPTURE_SCANS = ("capture_up", "capture_down", "capture_left", "capture_right")
+_PHASES = ("parse", "path", "piece") + _CAPTURE_SCANS + ("corner", "update", "win")
+_LINE_SCANS = dict(zip(((-1, 0), (1, 0), (0, -1), (0, 1)), _CAPTURE_SCANS))
+_REJECT_REASONS = ("game_over", "bad_square", "not_aligned", "blocked", "wrong_piece")
+
+
 class HasamiShogiGame:
     """
     This class is created to represent the running aspects of the Hasami Shogi game as a whole.
@@ -11,17 +24,25 @@ class HasamiShogiGame:
     square, and returning the board to be accessible elsewhere.
     """
 
-    def __init__(self):
+    def __init__(self, bitboard=False, size=_BOARD_SIZE):
         """
         This init method creates the board along with the starting player turn (Black), number of pieces captured,
-        as well as the winner of the game.
+        as well as the winner of the game. Passing BITBOARD as True stores the board as one integer mask per color
+        instead of a list of lists, which makes path and capture checks much cheaper. SIZE sets the number of rows and
+        columns, from 4 up to 26 (one letter per row); each side starts with a full row of SIZE pieces and wins by
+        capturing all but one of the other side's.
         """
-        self._board = ShogiBoard()
-        self._player_board = self._board.get_board()
+        self._tables = _get_tables(size)
+        if bitboard:
+            self._board = BitShogiBoard(size)
+        else:
+            self._board = ShogiBoard(size)
         self._player_turn = "BLACK"
         self._player_red_captured = 0
         self._player_black_captured = 0
         self._game_winner = "UNFINISHED"
+        self._move_stack = []
+        self._hash = self._compute_hash()
 
     def get_game_state(self):
         """
@@ -47,6 +68,86 @@ class HasamiShogiGame:
         elif color == "RED":
             return self._player_red_captured
 
+    def get_zobrist_hash(self):
+        """
+        This method returns a 64-bit number identifying the current position (every piece plus whose turn it is).
+        Equal positions reached through different move orders give the same number, so it can be used as a key
+        for a TranspositionTable. The number is kept up to date by every move, so editing the board directly with
+        set_board is not reflected in it.
+        """
+        return self._hash
+
+    def _compute_hash(self):
+        """
+        This method builds the Zobrist hash of the current position from scratch by XOR-ing together the key of
+        every piece on the board, plus the turn key when it is Red to move (or would be, after Black won).
+        """
+        position_hash = 0
+        black, red = self._board.get_masks()
+        for pieces, keys in ((black, self._tables.zobrist_black), (red, self._tables.zobrist_red)):
+            while pieces:
+                low = pieces & -pieces
+                pieces ^= low
+                position_hash ^= keys[low.bit_length() - 1]
+        if self._player_turn == "RED" or self._game_winner == "BLACK_WON":
+            position_hash ^= self._tables.zobrist_turn
+        return position_hash
+
+    def _update_hash(self, start, end, captured, color):
+        """
+        This method XORs the keys for one move by COLOR into the hash: the piece leaving START, the piece arriving
+        on END, every captured piece and the change of turn. Since XOR undoes itself, pop_move calls this again with
+        the same move to take it back out.
+        """
+        tables = self._tables
+        if color == "BLACK":
+            moved_keys, captured_keys = tables.zobrist_black, tables.zobrist_red
+        else:
+            moved_keys, captured_keys = tables.zobrist_red, tables.zobrist_black
+
+        position_hash = self._hash ^ moved_keys[start] ^ moved_keys[end] ^ tables.zobrist_turn
+        for square in captured:
+            position_hash ^= captured_keys[square]
+        self._hash = position_hash
+
+    def get_board(self):
+        """
+        This method returns the board object (either a ShogiBoard or a BitShogiBoard) so it can be printed with
+        build_board or edited elsewhere.
+        """
+        return self._board
+
+    def copy(self, bitboard=None):
+        """
+        This method returns a new game in the same position, with the same turn, capture counts and winner. The
+        copy uses a BitShogiBoard when BITBOARD is True and a ShogiBoard when it is False; by default it matches this
+        game. Moves made with push_move are not carried over, so the copy can't pop them.
+        """
+        if bitboard is None:
+            bitboard = isinstance(self._board, BitShogiBoard)
+        game = HasamiShogiGame(bitboard, self._tables.size)
+        game._set_position(self._get_position())
+        return game
+
+    def _get_position(self):
+        """
+        This method returns the whole position as a small tuple of numbers and strings: both occupancy masks, the
+        turn, both capture counters, the winner and the hash. It is much cheaper to keep than a copy of the game.
+        """
+        black, red = self._board.get_masks()
+        return (black, red, self._player_turn, self._player_red_captured, self._player_black_captured,
+                self._game_winner, self._hash)
+
+    def _set_position(self, position):
+        """
+        This method puts the game into a POSITION returned by _get_position. Moves made with push_move before this
+        can no longer be popped.
+        """
+        black, red, self._player_turn, self._player_red_captured, self._player_black_captured, self._game_winner, \
+            self._hash = position
+        self._board.set_masks(black, red)
+        self._move_stack.clear()
+
     def make_move(self, start, end):
         """
         This method moves a piece from a starting position to the ending position. It checks for any collisions along
@@ -57,317 +158,407 @@ class HasamiShogiGame:
             return False
 
         # Initializes start and end variables
-        start_row = self.get_row(start[0])
-        start_column = int(start[1])
-        square_to_move_from = self._player_board[start_row][start_column]
+        start_index = self._get_index(start)
+        end_index = self._get_index(end)
+        if start_index is None or end_index is None:
+            return False
+
+        # Moves made here can't be undone, so older push_move records no longer match the board
+        self._move_stack.clear()
+        return self._move(start_index, end_index) is not None
+
+    def push_move(self, start, end):
+        """
+        This method makes a move exactly like make_move, but also remembers what the move changed so that pop_move
+        can take it back. Only the moved piece, the captured squares, the capture counters, the turn and the winner
+        are recorded, so searching through many moves never needs a copy of the game.
+        """
+        start_index = self._get_index(start)
+        end_index = self._get_index(end)
+        if start_index is None or end_index is None:
+            return False
+        return self._push(start_index, end_index)
+
+    def _push(self, start, end):
+        """
+        This method is the square index version of push_move.
+        """
+        record = (start, end, self._player_red_captured, self._player_black_captured, self._player_turn,
+                  self._game_winner)
+        captured = self._move(start, end)
+        if captured is None:
+            return False
+        self._move_stack.append(record + (captured,))
+        return True
 
-        end_row = self.get_row(end[0])
-        end_column = int(end[1])
+    def pop_move(self):
+        """
+        This method takes back the last move made with push_move, putting the moved piece and any captured pieces
+        back and restoring the counters, turn and winner. It returns False if there is nothing to take back.
+        """
+        if not self._move_stack:
+            return False
+
+        start, end, red_captured, black_captured, turn, winner, captured = self._move_stack.pop()
+        if turn == "BLACK":
+            own, opponent = "B", "R"
+        else:
+            own, opponent = "R", "B"
+
+        self._board.set_square(end, ".")
+        self._board.set_square(start, own)
+        for square in captured:
+            self._board.set_square(square, opponent)
+        self._update_hash(start, end, captured, turn)
+
+        self._player_red_captured = red_captured
+        self._player_black_captured = black_captured
+        self._player_turn = turn
+        self._game_winner = winner
+        return True
+
+    def _move(self, start, end):
+        """
+        This method does the actual work of make_move using square indices (row * size + column, counting from
+        zero) instead of strings. It returns the list of captured square indices, or None if the move is not allowed.
+        """
+        if self._game_winner != "UNFINISHED":
+            return None
 
         # Checks every index between moves for collisions or overlaps
-        if start[0] == end[0]:  # Horizontal movement check
-            if end[1] > start[1]:
-                for i in range(int(start[1]), int(end[1])):
-                    if [end_row, i] != [start_row, start_column]:
-                        if self._player_board[end_row][i] == "B" or self._player_board[end_row][i] == "R":
-                            return False
-
-            elif start[1] > end[1]:
-                for i in range(int(end[1]), int(start[1])):
-                    if [end_row, i] != [start_row, start_column]:
-                        if self._player_board[end_row][i] == "B" or self._player_board[end_row][i] == "R":
-                            return False
-
-        elif start[1] == end[1]:  # Vertical movement check
-            if end[0] > start[0]:
-                for i in range(start_row, end_row):
-                    if [i, end_column] != [start_row, start_column]:
-                        if self._player_board[i][end_column] == "B" or self._player_board[i][end_column] == "R":
-                            return False
-
-            elif start[0] > end[0]:
-                for i in range(end_row, start_row):
-                    if [i, end_column] != [start_row, start_column]:
-                        if self._player_board[i][end_column] == "B" or self._player_board[i][end_column] == "R":
-                            return False
+        if not self._board.is_path_clear(start, end):
+            return None
+
+        # Checks to make sure proper piece is being moved
+        if self._player_turn == "BLACK":
+            if self._board.get_square(start) != "B":
+                return None
+        elif self._board.get_square(start) != "R":
+            return None
+
+        return self._apply(start, end)
+
+    def _apply(self, start, end):
+        """
+        This method makes a move that is already known to be legal: it moves the piece, takes any captures and updates
+        the hash, counters, turn and winner. It returns the list of captured square indices.
+        """
+        captured = self._board.move_piece(start, end)
+        self._finish_move(start, end, captured)
+        self._check_winner()
+        return captured
+
+    def _finish_move(self, start, end, captured):
+        """
+        This method is the part of _apply after the board has made the move from START to END and taken the
+        CAPTURED squares: it updates the hash, the capture counters and the turn.
+        """
+        self._update_hash(start, end, captured, self._player_turn)
 
+        if self._player_turn == "BLACK":
+            self._player_red_captured += len(captured)
+            self._player_turn = "RED"
         else:
+            self._player_black_captured += len(captured)
+            self._player_turn = "BLACK"
+
+    def _check_winner(self):
+        """
+        This method is the last step of _apply: it ends the game once either side has captured enough pieces.
+        """
+        if self._player_red_captured >= self._tables.win_captures:
+            self._game_winner = "BLACK_WON"
+            self._player_turn = None
+        elif self._player_black_captured >= self._tables.win_captures:
+            self._game_winner = "RED_WON"
+            self._player_turn = None
+
+    def enable_instrumentation(self, callback=None):
+        """
+        This method makes this game's make_move count and time each of its phases: parsing the squares, checking the
+        path, checking the piece, the capture scan in each direction (with the squares it walked), the corner check,
+        updating the hash, counters and turn, and the win check. Each phase runs the same code the plain make_move
+        does, since the board's capture code reports its own scans, so the times describe what production runs on
+        either board. The bitboard skips the four scans when no enemy piece touches the landing square, and then
+        reports only the corner check. Rejected moves are counted by reason. If CALLBACK is given it is called after
+        every make_move with a dictionary describing that one move, for feeding a metrics system.
+
+        Only this game's make_move is replaced, so games without instrumentation run exactly the same code as before
+        and pay nothing for it. push_move, apply_moves and the search code are not instrumented.
+        """
+        self._instrumentation = {"calls": 0, "accepted": 0, "captured": 0,
+                                 "rejected": dict.fromkeys(_REJECT_REASONS, 0),
+                                 "phases": {phase: {"count": 0, "total_ns": 0} for phase in _PHASES},
+                                 "squares_walked": dict.fromkeys(_CAPTURE_SCANS, 0)}
+        self._instrumentation_callback = callback
+        self.make_move = self._instrumented_make_move
+
+    def disable_instrumentation(self):
+        """
+        This method puts the plain make_move back and throws the counters away.
+        """
+        self.__dict__.pop("make_move", None)
+        self.__dict__.pop("_instrumentation", None)
+        self.__dict__.pop("_instrumentation_callback", None)
+
+    def get_instrumentation_snapshot(self, reset=False):
+        """
+        This method returns a copy of the instrumentation counters, or None if instrumentation is not enabled. Each
+        phase has a count and total nanoseconds, and each capture scan also has the number of squares it walked. With
+        RESET the counters start again from zero afterwards.
+        """
+        counters = self.__dict__.get("_instrumentation")
+        if counters is None:
+            return None
+        snapshot = {"calls": counters["calls"], "accepted": counters["accepted"], "captured": counters["captured"],
+                    "rejected": dict(counters["rejected"]),
+                    "phases": {phase: dict(totals) for phase, totals in counters["phases"].items()},
+                    "squares_walked": dict(counters["squares_walked"])}
+        if reset:
+            self.enable_instrumentation(self._instrumentation_callback)
+        return snapshot
+
+    def _instrumented_make_move(self, start, end):
+        """
+        This method is make_move with a timer around each step of _move and _apply: _get_index, is_path_clear, the
+        piece check, _finish_move and _check_winner. The board's move_piece is handed the timer as its stats sink, so
+        it times its own capture scans and corner check.
+        """
+        counters = self._instrumentation
+        phases = counters["phases"]
+        walked_totals = counters["squares_walked"]
+        clock = time.perf_counter_ns
+        record = {"start": start, "end": end, "accepted": False, "reason": None, "captured": 0, "phases": {},
+                  "squares_walked": {}}
+        counters["calls"] += 1
+
+        def timed(phase, started, walked=None):
+            elapsed = clock() - started
+            phases[phase]["count"] += 1
+            phases[phase]["total_ns"] += elapsed
+            record["phases"][phase] = elapsed
+            if walked is not None:
+                walked_totals[phase] += walked
+                record["squares_walked"][phase] = walked
+            return clock()
+
+        def reject(reason):
+            counters["rejected"][reason] += 1
+            record["reason"] = reason
+            if self._instrumentation_callback is not None:
+                self._instrumentation_callback(record)
             return False
 
-        # Player Black's turn
-        if self.get_active_player() == "BLACK":
-            if square_to_move_from == "B":  # Checks to make sure proper piece is being moved
-                self._board.set_board(end_row, end_column, self._player_board[start_row][start_column])
-                self._board.set_board(start_row, start_column, ".")  # Moves piece visually
-
-                # Makes sure index won't go off list
-                if end_row > 1:
-                    if self._player_board[end_row - 1][end_column] == "R":  # capturing upwards
-                        row_number = end_row - 1
-                        capturable_pieces = []
-                        is_capturable = False
-
-                        while self._player_board[row_number][end_column] == "R":
-                            if self._player_board[row_number - 1][end_column] == ".":
-                                is_capturable = False
-                                break
-
-                            if self._player_board[row_number - 1][end_column] == "B":
-                                is_capturable = True
-
-                            capturable_pieces.append([row_number, end_column])
-                            row_number -= 1
-
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._board.set_board(piece[0], end_column, ".")
-                                self._player_red_captured += 1
-
-                if end_row < 9:
-                    if self._player_board[end_row + 1][end_column] == "R":  # capturing downwards
-                        row_number = end_row + 1
-                        capturable_pieces = []
-                        is_capturable = False
-
-                        while self._player_board[row_number][end_column] == "R":
-                            if self._player_board[row_number + 1][end_column] == ".":
-                                is_capturable = False
-                                break
-
-                            if self._player_board[row_number + 1][end_column] == "B":
-                                is_capturable = True
-
-                            capturable_pieces.append([row_number, end_column])
-                            row_number += 1
-
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._board.set_board(piece[0], end_column, ".")
-                                self._player_red_captured += 1
-
-                if end_column > 1:
-                    if self._player_board[end_row][end_column - 1] == "R":  # capturing left
-                        column_number = end_column - 1
-                        capturable_pieces = []
-                        is_capturable = False
-
-                        while self._player_board[end_row][column_number] == "R":
-                            if self._player_board[end_row][column_number - 1] == ".":
-                                is_capturable = False
-                                break
-
-                            if self._player_board[end_row][column_number - 1] == "B":
-                                is_capturable = True
-
-                            capturable_pieces.append([end_row, column_number])
-                            column_number -= 1
-
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._board.set_board(end_row, piece[1], ".")
-                                self._player_red_captured += 1
-
-                if end_column < 9:
-                    if self._player_board[end_row][end_column + 1] == "R":  # capturing right
-                        column_number = end_column + 1
-                        capturable_pieces = []
-                        is_capturable = False
-
-                        while self._player_board[end_row][column_number] == "R":
-                            if self._player_board[end_row][column_number + 1] == ".":
-                                is_capturable = False
-                                break
-
-                            if self._player_board[end_row][column_number + 1] == "B":
-                                is_capturable = True
-
-                            capturable_pieces.append([end_row, column_number])
-                            column_number += 1
-
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._board.set_board(end_row, piece[1], ".")
-                                self._player_red_captured += 1
-
-                # Corner capture checks
-                if [end_row, end_column] == [1, 2] and self._player_board[2][1] == "B" \
-                        and self._player_board[1][1] == "R" \
-                        or [end_row, end_column] == [2, 1] and self._player_board[1][2] == "B" \
-                        and self._player_board[1][1] == "R":
-
-                    self._board.set_board(1, 1, ".")
-                    self._player_red_captured += 1
-
-                elif [end_row, end_column] == [9, 2] and self._player_board[8][1] == "B" \
-                        and self._player_board[9][1] == "R" \
-                        or [end_row, end_column] == [8, 1] and self._player_board[9][2] == "B" \
-                        and self._player_board[9][1] == "R":
-                    self._board.set_board(9, 1, ".")
-                    self._player_red_captured += 1
-
-                elif [end_row, end_column] == [1, 8] and self._player_board[2][9] == "B" \
-                        and self._player_board[1][9] == "R" \
-                        or [end_row, end_column] == [2, 9] and self._player_board[1][8] == "B" \
-                        and self._player_board[1][9] == "R":
-                    self._board.set_board(1, 9, ".")
-                    self._player_red_captured += 1
-
-                elif [end_row, end_column] == [8, 9] and self._player_board[9][8] == "B" \
-                        and self._player_board[9][9] == "R" \
-                        or [end_row, end_column] == [9, 8] and self._player_board[8][9] == "B" \
-                        and self._player_board[9][9] == "R":
-                    self._board.set_board(9, 9, ".")
-                    self._player_red_captured += 1
-            else:
-                return False
+        if self._game_winner != "UNFINISHED":
+            return reject("game_over")
+
+        started = clock()
+        start_index = self._get_index(start)
+        end_index = self._get_index(end)
+        timed("parse", started)
+        if start_index is None or end_index is None:
+            return reject("bad_square")
+        self._move_stack.clear()
+
+        started = clock()
+        path_clear = self._board.is_path_clear(start_index, end_index)
+        timed("path", started)
+        if not path_clear:
+            return reject("not_aligned" if self._tables.between[start_index][end_index] is None else "blocked")
+
+        started = clock()
+        right_piece = self._board.get_square(start_index) == ("B" if self._player_turn == "BLACK" else "R")
+        timed("piece", started)
+        if not right_piece:
+            return reject("wrong_piece")
+
+        captured = self._board.move_piece(start_index, end_index, timed)
+
+        started = clock()
+        self._finish_move(start_index, end_index, captured)
+        timed("update", started)
+
+        started = clock()
+        self._check_winner()
+        timed("win", started)
+
+        counters["accepted"] += 1
+        counters["captured"] += len(captured)
+        if "_move_maps" in self.__dict__:
+            self._update_move_maps(start_index, end_index, captured)
+        record["accepted"] = True
+        record["captured"] = len(captured)
+        if self._instrumentation_callback is not None:
+            self._instrumentation_callback(record)
+        return True
+
+    def enable_move_maps(self):
+        """
+        This method makes this game keep two maps up to date as moves are made and taken back: where each piece
+        can slide to, and what each color would capture by landing on each empty square. After a move only the rows
+        and columns of the squares that changed are worked out again (plus the squares whose corner check reads one
+        of them), since nothing else can have changed.
 
-            self._player_turn = "RED"
-            if self._player_red_captured >= 8:
-                self._game_winner = "BLACK_WON"
-                self._player_turn = None
-            return True
+        Like enable_instrumentation this swaps methods on this one game, so games without the maps pay nothing.
+        """
+        self._move_maps = _MoveMaps(self._tables)
+        self._move_maps.refresh(*self._board.get_masks(), self._tables.full)
+        self._apply = self._apply_with_maps
+        self.pop_move = self._pop_move_with_maps
+        self._set_position = self._set_position_with_maps
 
-        if self.get_active_player() == "RED":
-            if square_to_move_from == "R":
-                self._board.set_board(end_row, end_column, self._player_board[start_row][start_column])
-                self._board.set_board(start_row, start_column, ".")
-
-                if end_row > 1:
-                    if self._player_board[end_row - 1][end_column] == "B":  # up
-                        row_number = end_row - 1
-                        capturable_pieces = []
-                        is_capturable = False
-
-                        while self._player_board[row_number][end_column] == "B":
-                            if self._player_board[row_number - 1][end_column] == ".":
-                                is_capturable = False
-                                break
-
-                            if self._player_board[row_number - 1][end_column] == "R":
-                                is_capturable = True
-
-                            capturable_pieces.append([row_number, end_column])
-                            row_number -= 1
-
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._player_board[piece[0]][end_column] = "."
-                                self._player_black_captured += 1
-
-                if end_row < 9:
-                    if self._player_board[end_row + 1][end_column]:  # down
-                        row_number = end_row + 1
-                        capturable_pieces = []
-                        is_capturable = False
-                        while self._player_board[row_number][end_column] == "B":
-                            if self._player_board[row_number + 1][end_column] == ".":
-                                is_capturable = False
-                                break
-                            if self._player_board[row_number + 1][end_column] == "R":
-                                is_capturable = True
-                            capturable_pieces.append([row_number, end_column])
-                            row_number += 1
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._player_board[piece[0]][end_column] = "."
-                                self._player_black_captured += 1
-
-                if end_column > 1:
-                    if self._player_board[end_row][end_column - 1]:  # left
-                        column_number = end_column - 1
-                        capturable_pieces = []
-                        is_capturable = False
-                        while self._player_board[end_row][column_number] == "B":
-                            if self._player_board[end_row][column_number - 1] == ".":
-                                is_capturable = False
-                                break
-                            if self._player_board[end_row][column_number - 1] == "R":
-                                is_capturable = True
-                            capturable_pieces.append([end_row, column_number])
-                            column_number -= 1
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._player_board[end_row][piece[1]] = "."
-                                self._player_black_captured += 1
-
-                if end_column < 9:
-                    if self._player_board[end_row][end_column + 1]:  # right
-                        column_number = end_column + 1
-                        capturable_pieces = []
-                        is_capturable = False
-                        while self._player_board[end_row][column_number] == "B":
-                            if self._player_board[end_row][column_number + 1] == ".":
-                                is_capturable = False
-                                break
-                            if self._player_board[end_row][column_number + 1] == "R":
-                                is_capturable = True
-                            capturable_pieces.append([end_row, column_number])
-                            column_number += 1
-                        if is_capturable is True:
-                            for piece in capturable_pieces:
-                                self._player_board[end_row][piece[1]] = "."
-                                self._player_black_captured += 1
-
-                # Corner capture checks
-                if [end_row, end_column] == [1, 2] and self._player_board[2][1] == "R" \
-                        and self._player_board[1][1] == "B" \
-                        or [end_row, end_column] == [2, 1] and self._player_board[1][2] == "R" \
-                        and self._player_board[1][1] == "B":
-
-                    self._board.set_board(1, 1, ".")
-                    self._player_black_captured += 1
-
-                elif [end_row, end_column] == [9, 2] and self._player_board[8][1] == "R" \
-                        and self._player_board[9][1] == "B" \
-                        or [end_row, end_column] == [8, 1] and self._player_board[9][2] == "R" \
-                        and self._player_board[9][1] == "B":
-                    self._board.set_board(9, 1, ".")
-                    self._player_black_captured += 1
-
-                elif [end_row, end_column] == [1, 8] and self._player_board[2][9] == "R" \
-                        and self._player_board[1][9] == "B" \
-                        or [end_row, end_column] == [2, 9] and self._player_board[1][8] == "R" \
-                        and self._player_board[1][9] == "B":
-                    self._board.set_board(1, 9, ".")
-                    self._player_black_captured += 1
-
-                elif [end_row, end_column] == [8, 9] and self._player_board[9][8] == "R" \
-                        and self._player_board[9][9] == "B" \
-                        or [end_row, end_column] == [9, 8] and self._player_board[8][9] == "R" \
-                        and self._player_board[9][9] == "B":
-                    self._board.set_board(9, 9, ".")
-                    self._player_black_captured += 1
-            else:
-                return False
+    def disable_move_maps(self):
+        """
+        This method stops keeping the maps and throws them away.
+        """
+        for name in ("_move_maps", "_apply", "pop_move", "_set_position"):
+            self.__dict__.pop(name, None)
 
-            self._player_turn = "BLACK"
-            if self._player_black_captured >= 8:
-                self._game_winner = "RED_WON"
-                self._player_turn = None
-            return True
+    def get_mobility(self, square):
+        """
+        This method returns the squares the piece on SQUARE can slide to, whoever's turn it is, or an empty list for
+        an empty square. It returns None if the maps are not enabled or SQUARE is not on the board.
+        """
+        maps = self.__dict__.get("_move_maps")
+        index = self._get_index(square)
+        if maps is None or index is None:
+            return None
+        return _mask_names(maps.mobility[index], self._tables.names)
+
+    def get_capture_threats(self, square, color):
+        """
+        This method returns the squares of the pieces the COLOR player would capture by moving some piece onto the
+        empty SQUARE, or an empty list if no such move captures. It returns None if the maps are not enabled or
+        SQUARE is not on the board.
+        """
+        maps = self.__dict__.get("_move_maps")
+        index = self._get_index(square)
+        if maps is None or index is None or color not in maps.threats:
+            return None
+        return _mask_names(maps.threats[color][index], self._tables.names)
+
+    def get_capture_squares(self, color):
+        """
+        This method returns every square the COLOR player could move a piece onto to capture something, or None if
+        the maps are not enabled.
+        """
+        maps = self.__dict__.get("_move_maps")
+        if maps is None or color not in maps.capture_squares:
+            return None
+        return _mask_names(maps.capture_squares[color], self._tables.names)
+
+    def _update_move_maps(self, start, end, captured):
+        """
+        This method works the maps out again on the lines of the START, END and CAPTURED squares.
+        """
+        lines = self._tables.lines
+        corner_readers = self._tables.corner_readers
+        squares = lines[start] | lines[end] | corner_readers[start] | corner_readers[end]
+        for square in captured:
+            squares |= lines[square] | corner_readers[square]
+        self._move_maps.refresh(*self._board.get_masks(), squares)
+
+    def _apply_with_maps(self, start, end):
+        """
+        This method is _apply followed by an update of the maps.
+        """
+        captured = HasamiShogiGame._apply(self, start, end)
+        self._update_move_maps(start, end, captured)
+        return captured
+
+    def _pop_move_with_maps(self):
+        """
+        This method is pop_move followed by an update of the maps.
+        """
+        if not self._move_stack:
+            return False
+        start, end, _, _, _, _, captured = self._move_stack[-1]
+        HasamiShogiGame.pop_move(self)
+        self._update_move_maps(start, end, captured)
+        return True
+
+    def _set_position_with_maps(self, position):
+        """
+        This method is _set_position followed by working out the maps for the whole board.
+        """
+        HasamiShogiGame._set_position(self, position)
+        self._move_maps.refresh(*self._board.get_masks(), self._tables.full)
+
+    def apply_moves(self, moves, validate=True):
+        """
+        This method plays a whole sequence of (start, end) MOVES and returns how many were made. With VALIDATE each
+        move goes through make_move and the sequence stops at the first move that is refused. With VALIDATE False the
+        moves are trusted, as for a stored record that was checked when it was saved: squares are looked up in a
+        table and the path and turn checks are skipped, so an illegal move leaves the game in a broken state.
+        """
+        applied = 0
+        if validate:
+            for start, end in moves:
+                if not self.make_move(start, end):
+                    break
+                applied += 1
+            return applied
+
+        indexes = self._tables.indexes
+        self._move_stack.clear()
+        for start, end in moves:
+            self._apply(indexes[start], indexes[end])
+            applied += 1
+        return applied
+
+    def legal_moves(self, color):
+        """
+        This method yields every move the COLOR player could make as (start, end) square pairs such as ("i3", "d3").
+        The moves are rook-style slides that stop before the first occupied square, which are exactly the moves
+        make_move accepts when it is COLOR's turn. Nothing is yielded once the game is over.
+        """
+        names = self._tables.names
+        for start, end in self._generate_moves(color):
+            yield names[start], names[end]
+
+    def _generate_moves(self, color):
+        """
+        This method is the square index version of legal_moves. It walks the precomputed rays out of each of the
+        COLOR player's pieces and yields (start, end) index pairs.
+        """
+        if self._game_winner != "UNFINISHED":
+            return
+
+        black, red = self._board.get_masks()
+        if color == "BLACK":
+            pieces = black
+        elif color == "RED":
+            pieces = red
+        else:
+            return
+
+        occupied = black | red
+        rays = self._tables.rays
+        bits = self._tables.bits
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            start = low.bit_length() - 1
+            for ray in rays[start]:
+                for end in ray:
+                    if occupied & bits[end]:
+                        break
+                    yield start, end
 
     def get_row(self, char):
         """
-        This method determines the numerical match to a particular row's letter for iteration.
-        """
-        if char == "a":
-            return 1
-        if char == "b":
-            return 2
-        if char == "c":
-            return 3
-        if char == "d":
-            return 4
-        if char == "e":
-            return 5
-        if char == "f":
-            return 6
-        if char == "g":
-            return 7
-        if char == "h":
-            return 8
-        if char == "i":
-            return 9
+        This method determines the numerical match to a particular row's letter for iteration, from 1 for "a" up to
+        the board size, or None if CHAR is not a row on this board.
+        """
+        if len(char) == 1 and "a" <= char < chr(ord("a") + self._tables.size):
+            return ord(char) - ord("a") + 1
+
+    def _get_index(self, square):
+        """
+        This method turns a SQUARE such as "d3" into its square index (row * size + column, counting from zero),
+        or None if the square is not on the board.
+        """
+        return self._tables.indexes.get(square)
 
     def get_square_occupant(self, square):
 
@@ -375,31 +566,200 @@ class HasamiShogiGame:
         This method returns the player occupying a particular square that is provided in the SQUARE
         parameter (if there is one) otherwise it will return none
         """
-        if self._player_board[self.get_row(square[0])][int(square[1])] == 'B':
+        piece = self._board.get_square(self._get_index(square))
+        if piece == 'B':
             return "BLACK"
-        elif self._player_board[self.get_row(square[0])][int(square[1])] == 'R':
+        elif piece == 'R':
             return "RED"
         else:
             return "NONE"
 
+    def to_compact(self):
+        """
+        This method returns a CompactHasamiShogiGame in the same position, for keeping the game around cheaply.
+        """
+        compact = CompactHasamiShogiGame(self._tables.size)
+        compact._set_position(self._get_position())
+        return compact
+
+
+class CompactHasamiShogiGame:
+    """
+    This class is a small version of HasamiShogiGame for holding very many games in memory at once. It has no
+    board object, no move history and no per-instance dictionary: just the two occupancy masks, the turn, the
+    capture counters, the winner and the hash. A new game points at one shared copy of the starting position's
+    values, and a move only creates new values for what it changed, so an unplayed game costs about a hundred bytes.
+
+    make_move, get_square_occupant and the other getters behave exactly like HasamiShogiGame's. For push_move,
+    pop_move, searching or the maps, turn it into a full game with to_game.
+    """
+
+    __slots__ = ("_tables", "_black", "_red", "_player_turn", "_player_red_captured", "_player_black_captured",
+                 "_game_winner", "_hash")
+
+    def __init__(self, size=_BOARD_SIZE):
+        """
+        This init method sets up the starting position on a SIZE by SIZE board with Black to move.
+        """
+        self._tables = _get_tables(size)
+        self._black = self._tables.last_row
+        self._red = self._tables.first_row
+        self._player_turn = "BLACK"
+        self._player_red_captured = 0
+        self._player_black_captured = 0
+        self._game_winner = "UNFINISHED"
+        self._hash = self._tables.opening_hash
+
+    def get_game_state(self):
+        """
+        This method returns "UNFINISHED", "BLACK_WON" or "RED_WON".
+        """
+        return self._game_winner
+
+    def get_active_player(self):
+        """
+        This method returns whose turn it is, or None once the game is over.
+        """
+        return self._player_turn
+
+    def get_num_captured_pieces(self, color):
+        """
+        This method returns how many of COLOR's pieces have been captured.
+        """
+        if color == "BLACK":
+            return self._player_black_captured
+        elif color == "RED":
+            return self._player_red_captured
+
+    def get_zobrist_hash(self):
+        """
+        This method returns the same position hash a HasamiShogiGame in this position would.
+        """
+        return self._hash
+
+    def get_board(self):
+        """
+        This method returns a new BitShogiBoard holding the current position, for printing. Changing it does not
+        change the game.
+        """
+        board = BitShogiBoard(self._tables.size)
+        board.set_masks(self._black, self._red)
+        return board
+
+    def get_square_occupant(self, square):
+        """
+        This method returns "BLACK", "RED" or "NONE" for the piece on SQUARE.
+        """
+        bit = 1 << self._tables.indexes.get(square)
+        if self._black & bit:
+            return "BLACK"
+        elif self._red & bit:
+            return "RED"
+        else:
+            return "NONE"
+
+    def legal_moves(self, color):
+        """
+        This method yields the moves the COLOR player could make, as HasamiShogiGame.legal_moves does.
+        """
+        return self.to_game(bitboard=True).legal_moves(color)
+
+    def make_move(self, start, end):
+        """
+        This method makes the move from START to END with the same checks, captures and win rules as
+        HasamiShogiGame.make_move, and returns whether the move was made.
+        """
+        if self._game_winner != "UNFINISHED":
+            return False
+
+        tables = self._tables
+        start = tables.indexes.get(start)
+        end = tables.indexes.get(end)
+        if start is None or end is None:
+            return False
+
+        # Checks that the squares share a line with nothing in the way, and that the right piece is moving
+        between = tables.between[start][end]
+        if between is None or (self._black | self._red) & between:
+            return False
+        black_to_move = self._player_turn == "BLACK"
+        own, opponent = (self._black, self._red) if black_to_move else (self._red, self._black)
+        if not own & tables.bits[start]:
+            return False
+
+        own ^= tables.bits[start] | tables.bits[end]
+        taken = tables.captures(own, opponent, end)
+        opponent ^= taken
+
+        if black_to_move:
+            moved_keys, captured_keys = tables.zobrist_black, tables.zobrist_red
+        else:
+            moved_keys, captured_keys = tables.zobrist_red, tables.zobrist_black
+        position_hash = self._hash ^ moved_keys[start] ^ moved_keys[end] ^ tables.zobrist_turn
+        count = 0
+        while taken:
+            low = taken & -taken
+            taken ^= low
+            position_hash ^= captured_keys[low.bit_length() - 1]
+            count += 1
+        self._hash = position_hash
+
+        if black_to_move:
+            self._black, self._red = own, opponent
+            self._player_red_captured += count
+            self._player_turn = "RED"
+            if self._player_red_captured >= tables.win_captures:
+                self._game_winner = "BLACK_WON"
+                self._player_turn = None
+        else:
+            self._red, self._black = own, opponent
+            self._player_black_captured += count
+            self._player_turn = "BLACK"
+            if self._player_black_captured >= tables.win_captures:
+                self._game_winner = "RED_WON"
+                self._player_turn = None
+        return True
+
+    def to_game(self, bitboard=True):
+        """
+        This method returns a full HasamiShogiGame in the same position.
+        """
+        game = HasamiShogiGame(bitboard, self._tables.size)
+        game._set_position(self._get_position())
+        return game
+
+    def _get_position(self):
+        """
+        This method returns the position in the same form as HasamiShogiGame._get_position.
+        """
+        return (self._black, self._red, self._player_turn, self._player_red_captured, self._player_black_captured,
+                self._game_winner, self._hash)
+
+    def _set_position(self, position):
+        """
+        This method puts the game into a POSITION from _get_position.
+        """
+        self._black, self._red, self._player_turn, self._player_red_captured, self._player_black_captured, \
+            self._game_winner, self._hash = position
+
 
 class ShogiBoard:
-    def __init__(self):
-        """
-        This init method will hard code the board into a list of lists so that the starting positions of
-        both players can be set every time the game resets
-        """
-        self._begin_board = [
-            [" ", "1", "2", "3", "4", "5", "6", "7", "8", "9"],
-            ["a", "R", "R", "R", "R", "R", "R", "R", "R", "R"],
-            ["b", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["c", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["d", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["e", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["f", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["g", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["h", ".", ".", ".", ".", ".", ".", ".", ".", "."],
-            ["i", "B", "B", "B", "B", "B", "B", "B", "B", "B"]]
+    def __init__(self, size=_BOARD_SIZE):
+        """
+        This init method will build the SIZE by SIZE board into a list of lists so that the starting positions of
+        both players can be set every time the game resets. The first list and the first entry of every other
+        list are the column numbers and row letters.
+        """
+        self._size = size
+        self._begin_board = [[" "] + list(_get_tables(size).column_labels)]
+        for row in range(size):
+            if row == 0:
+                piece = "R"
+            elif row == size - 1:
+                piece = "B"
+            else:
+                piece = "."
+            self._begin_board.append([chr(ord("a") + row)] + [piece] * size)
 
     def set_board(self, row, col, set_value):
         """
@@ -409,22 +769,718 @@ class ShogiBoard:
         """
         self._begin_board[row][col] = set_value
 
+    def get_square(self, index):
+        """
+        This method returns the piece ("B", "R" or ".") on the square with the given INDEX, counting squares
+        from zero across each row starting at a1.
+        """
+        row, column = divmod(index, self._size)
+        return self._begin_board[row + 1][column + 1]
+
+    def set_square(self, index, set_value):
+        """
+        This method is the same as set_board but takes a square INDEX instead of a row and column.
+        """
+        row, column = divmod(index, self._size)
+        self._begin_board[row + 1][column + 1] = set_value
+
+    def get_masks(self):
+        """
+        This method returns a (black, red) pair of integers with bit number INDEX set for every square that color
+        occupies.
+        """
+        size = self._size
+        black = 0
+        red = 0
+        for row in range(size):
+            for column in range(size):
+                piece = self._begin_board[row + 1][column + 1]
+                if piece == "B":
+                    black |= 1 << row * size + column
+                elif piece == "R":
+                    red |= 1 << row * size + column
+        return black, red
+
+    def set_masks(self, black, red):
+        """
+        This method fills the board from a (BLACK, RED) pair of occupancy masks like the ones get_masks returns.
+        """
+        size = self._size
+        for row in range(size):
+            for column in range(size):
+                bit = 1 << row * size + column
+                if black & bit:
+                    self._begin_board[row + 1][column + 1] = "B"
+                elif red & bit:
+                    self._begin_board[row + 1][column + 1] = "R"
+                else:
+                    self._begin_board[row + 1][column + 1] = "."
+
+    def is_path_clear(self, start, end):
+        """
+        This method checks that the START and END square indices share a row or column and that every square
+        after START up to and including END is empty.
+        """
+        start_row, start_column = divmod(start, self._size)
+        end_row, end_column = divmod(end, self._size)
+
+        if start_row == end_row:  # Horizontal movement check
+            if start_column == end_column:
+                return False
+            step = 1 if end_column > start_column else -1
+            for i in range(start_column + step, end_column + step, step):
+                if self._begin_board[end_row + 1][i + 1] != ".":
+                    return False
+            return True
+
+        if start_column == end_column:  # Vertical movement check
+            step = 1 if end_row > start_row else -1
+            for i in range(start_row + step, end_row + step, step):
+                if self._begin_board[i + 1][end_column + 1] != ".":
+                    return False
+            return True
+
+        return False
+
+    def move_piece(self, start, end, stats=None):
+        """
+        This method moves the piece on START to END and removes every enemy piece that the move sandwiches,
+        including the corner captures. It returns a list of the captured square indices. STATS, if given, is the
+        make_move instrumentation's timer, which each capture scan and the corner check report to.
+        """
+        start_row, start_column = divmod(start, self._size)
+        end_row, end_column = divmod(end, self._size)
+        own = self._begin_board[start_row + 1][start_column + 1]
+        opponent = "R" if own == "B" else "B"
+
+        self._begin_board[end_row + 1][end_column + 1] = own
+        self._begin_board[start_row + 1][start_column + 1] = "."  # Moves piece visually
+
+        captured = []
+        captured += self._capture_line(end_row + 1, end_column + 1, -1, 0, own, opponent, stats)  # capturing upwards
+        captured += self._capture_line(end_row + 1, end_column + 1, 1, 0, own, opponent, stats)  # capturing downwards
+        captured += self._capture_line(end_row + 1, end_column + 1, 0, -1, own, opponent, stats)  # capturing left
+        captured += self._capture_line(end_row + 1, end_column + 1, 0, 1, own, opponent, stats)  # capturing right
+
+        # Corner capture checks
+        corner = self._capture_corner(end_row + 1, end_column + 1, own, opponent, stats)
+        if corner is not None:
+            captured.append(corner)
+        return captured
+
+    def _capture_line(self, end_row, end_column, row_step, column_step, own, opponent, stats=None):
+        """
+        This method walks away from the landing square in one direction collecting a run of enemy pieces. If the run
+        is closed off by one of the mover's own pieces, the run is removed and its square indices are returned. If
+        STATS is given the scan's time and the number of squares it looked at are reported to it.
+        """
+        if stats is not None:
+            started = time.perf_counter_ns()
+        size = self._size
+        row_number = end_row + row_step
+        column_number = end_column + column_step
+        capturable_pieces = []
+
+        # Makes sure index won't go off list
+        while 1 <= row_number <= size and 1 <= column_number <= size \
+                and self._begin_board[row_number][column_number] == opponent:
+            capturable_pieces.append([row_number, column_number])
+            row_number += row_step
+            column_number += column_step
+
+        captured = []
+        if capturable_pieces and 1 <= row_number <= size and 1 <= column_number <= size \
+                and self._begin_board[row_number][column_number] == own:
+            for piece in capturable_pieces:
+                self._begin_board[piece[0]][piece[1]] = "."
+                captured.append((piece[0] - 1) * size + piece[1] - 1)
+
+        if stats is not None:
+            on_board = 1 <= row_number <= size and 1 <= column_number <= size
+            stats(_LINE_SCANS[row_step, column_step], started, len(capturable_pieces) + on_board)
+        return captured
+
+    def _capture_corner(self, end_row, end_column, own, opponent, stats=None):
+        """
+        This method checks the four corner captures, where a piece in the corner is taken by enemy pieces on both
+        squares next to it. It returns the captured corner's square index, or None. If STATS is given the check's
+        time is reported to it.
+        """
+        if stats is not None:
+            started = time.perf_counter_ns()
+        last = self._size
+        captured = None
+        for corner, first_side, second_side in (((1, 1), (1, 2), (2, 1)),
+                                                ((last, 1), (last, 2), (last - 1, 1)),
+                                                ((1, last), (1, last - 1), (2, last)),
+                                                ((last, last), (last - 1, last), (last, last - 1))):
+            if self._begin_board[corner[0]][corner[1]] != opponent:
+                continue
+            if (end_row, end_column) == first_side and self._begin_board[second_side[0]][second_side[1]] == own \
+                    or (end_row, end_column) == second_side and self._begin_board[first_side[0]][first_side[1]] == own:
+                self._begin_board[corner[0]][corner[1]] = "."
+                captured = (corner[0] - 1) * last + corner[1] - 1
+                break
+
+        if stats is not None:
+            stats("corner", started)
+        return captured
+
     def build_board(self):
         """
         This method is simply for printing purposes and proper formatting, returns each list in the list of lists
-        with spaces in between to make a perfect board.
+        with spaces in between to make a perfect board. Every cell is padded to the width of the widest label, so
+        the columns still line up once the labels reach two digits.
         """
-
+        width = _get_tables(self._size).label_width
         board_string = ""
         for i in range(len(self._begin_board)):
             for o in range(len(self._begin_board[i])):
-                board_string += (self._begin_board[i][o])
+                board_string += self._begin_board[i][o].rjust(width)
             board_string += "\n"
         print(board_string)
 
     def get_board(self):
         """
-        This get method is meant to return the beginning board for initialization of the game once
-        it first starts, used by the init method of the HasamiShogiGame class.
+        This get method returns the board's list of lists itself, label row and column included, so
+        changing the returned lists changes the board.
         """
         return self._begin_board
+
+
+class BitShogiBoard:
+    """
+    This class is a drop-in replacement for ShogiBoard that stores each color as one integer, where bit number
+    row * size + column is set when that color has a piece on the square. Path checks and captures are done with
+    masks and shifts instead of walking lists.
+    """
+
+    def __init__(self, size=_BOARD_SIZE):
+        """
+        This init method sets up the starting position on a SIZE by SIZE board, Red along row a and Black along the
+        last row.
+        """
+        self._tables = _get_tables(size)
+        self._red = self._tables.first_row
+        self._black = self._tables.last_row
+
+    def set_board(self, row, col, set_value):
+        """
+        This set method works like ShogiBoard.set_board, using the row and column numbers of the printed board.
+        """
+        self.set_square((row - 1) * self._tables.size + col - 1, set_value)
+
+    def get_square(self, index):
+        """
+        This method returns the piece ("B", "R" or ".") on the square with the given INDEX.
+        """
+        bit = 1 << index
+        if self._black & bit:
+            return "B"
+        if self._red & bit:
+            return "R"
+        return "."
+
+    def set_square(self, index, set_value):
+        """
+        This method places SET_VALUE ("B", "R" or ".") on the square with the given INDEX.
+        """
+        bit = 1 << index
+        self._black &= ~bit
+        self._red &= ~bit
+        if set_value == "B":
+            self._black |= bit
+        elif set_value == "R":
+            self._red |= bit
+
+    def get_masks(self):
+        """
+        This method returns the (black, red) pair of occupancy masks.
+        """
+        return self._black, self._red
+
+    def set_masks(self, black, red):
+        """
+        This method replaces the board with the (BLACK, RED) pair of occupancy masks.
+        """
+        self._black = black
+        self._red = red
+
+    def is_path_clear(self, start, end):
+        """
+        This method checks that START and END share a row or column and that nothing sits on the squares after
+        START up to and including END, using the precomputed mask of squares between them.
+        """
+        between = self._tables.between[start][end]
+        return between is not None and not (self._black | self._red) & between
+
+    def move_piece(self, start, end, stats=None):
+        """
+        This method moves the piece on START to END, removes every enemy piece that the move sandwiches (including
+        corner captures) and returns a list of the captured square indices. STATS is passed on to captures.
+        """
+        move = (1 << start) | (1 << end)
+        if self._black >> start & 1:
+            self._black ^= move
+            captured = self._tables.captures(self._black, self._red, end, stats)
+            self._red ^= captured
+        else:
+            self._red ^= move
+            captured = self._tables.captures(self._red, self._black, end, stats)
+            self._black ^= captured
+
+        squares = []
+        while captured:
+            low = captured & -captured
+            squares.append(low.bit_length() - 1)
+            captured ^= low
+        return squares
+
+    def build_board(self):
+        """
+        This method prints the board in the same format as ShogiBoard.build_board.
+        """
+        width = self._tables.label_width
+        board_string = ""
+        for row in self.get_board():
+            board_string += "".join(cell.rjust(width) for cell in row) + "\n"
+        print(board_string)
+
+    def get_board(self):
+        """
+        This method returns a new list of lists laid out like ShogiBoard's board, including the label row and
+        column. Changing the returned lists does not change the board.
+        """
+        size = self._tables.size
+        board = [[" "] + list(self._tables.column_labels)]
+        for row in range(size):
+            board.append([chr(ord("a") + row)] + [self.get_square(row * size + column) for column in range(size)])
+        return board
+
+
+class _MoveMaps:
+    """
+    This class holds the maps kept by HasamiShogiGame.enable_move_maps: each piece's reachable squares, and for
+    each color and empty square the mask of pieces a move landing there would capture, with a mask of the squares
+    where that is anything at all.
+    """
+
+    __slots__ = ("tables", "mobility", "threats", "capture_squares")
+
+    def __init__(self, tables):
+        """
+        This init method creates empty maps for the board described by TABLES.
+        """
+        squares = tables.size * tables.size
+        self.tables = tables
+        self.mobility = [0] * squares
+        self.threats = {"BLACK": [0] * squares, "RED": [0] * squares}
+        self.capture_squares = {"BLACK": 0, "RED": 0}
+
+    def refresh(self, black, red, squares):
+        """
+        This method works out the maps again for every square in the mask SQUARES. One walk along the four rays of a
+        square finds both where a piece there could go and which pieces could land there.
+        """
+        occupied = black | red
+        rays = self.tables.rays
+        bits = self.tables.bits
+        captures = self.tables.captures
+        mobility = self.mobility
+        black_threats = self.threats["BLACK"]
+        red_threats = self.threats["RED"]
+        black_squares = self.capture_squares["BLACK"]
+        red_squares = self.capture_squares["RED"]
+
+        while squares:
+            low = squares & -squares
+            squares ^= low
+            square = low.bit_length() - 1
+
+            reached = 0
+            black_taken = 0
+            red_taken = 0
+            for ray in rays[square]:
+                for other in ray:
+                    bit = bits[other]
+                    if occupied & bit:
+                        # The first piece along the ray is the only one on it that could slide here
+                        if not occupied & low:
+                            if black & bit:
+                                black_taken |= captures(black ^ bit ^ low, red, square)
+                            else:
+                                red_taken |= captures(red ^ bit ^ low, black, square)
+                        break
+                    reached |= bit
+
+            mobility[square] = reached if occupied & low else 0
+            black_threats[square] = black_taken
+            red_threats[square] = red_taken
+            black_squares = black_squares | low if black_taken else black_squares & ~low
+            red_squares = red_squares | low if red_taken else red_squares & ~low
+
+        self.capture_squares["BLACK"] = black_squares
+        self.capture_squares["RED"] = red_squares
+
+
+def _mask_names(mask, names):
+    """
+    This function returns the NAMES of the squares set in MASK, in board order.
+    """
+    result = []
+    while mask:
+        low = mask & -mask
+        mask ^= low
+        result.append(names[low.bit_length() - 1])
+    return result
+
+
+def _build_position(black, red, turn, red_captured=0, black_captured=0, winner="UNFINISHED", size=_BOARD_SIZE):
+    """
+    This function returns a position in the form _get_position uses, made from the BLACK and RED occupancy masks
+    and the rest of the state given, with its Zobrist hash worked out from them.
+    """
+    game = HasamiShogiGame(True, size)
+    game._set_position((black, red, turn, red_captured, black_captured, winner, 0))
+    game._hash = game._compute_hash()
+    return game._get_position()
+
+
+class ReplayIndex:
+    """
+    This class answers "what was the position after move N" for one stored game without replaying it from the
+    start each time. It plays the game through once and keeps a snapshot of the position every INTERVAL moves, so any
+    later question costs at most INTERVAL - 1 moves of work.
+    """
+
+    def __init__(self, moves, interval=32, validate=True, bitboard=True, size=_BOARD_SIZE):
+        """
+        This init method replays MOVES, a list of (start, end) pairs, keeping a snapshot every INTERVAL moves. With
+        VALIDATE every move is checked once here, and a ValueError names the first illegal one; the replays done
+        later skip the checks. BITBOARD picks the board backend of the games that are handed out, and SIZE the board
+        the game was played on.
+        """
+        if interval < 1:
+            raise ValueError("interval must be at least 1")
+
+        self._interval = interval
+        self._bitboard = bitboard
+        self._size = size
+        indexes = _get_tables(size).indexes
+        self._moves = []
+        for number, (start, end) in enumerate(moves):
+            if start not in indexes or end not in indexes:
+                raise ValueError("move " + str(number) + " has a square that is not on the board")
+            self._moves.append((indexes[start], indexes[end]))
+
+        game = HasamiShogiGame(True, size)
+        self._snapshots = [game._get_position()]
+        for number, (start, end) in enumerate(self._moves):
+            if validate:
+                if game._move(start, end) is None:
+                    raise ValueError("move " + str(number) + " is not legal")
+            else:
+                game._apply(start, end)
+            if (number + 1) % interval == 0:
+                self._snapshots.append(game._get_position())
+
+    def __len__(self):
+        """
+        This method returns how many moves the game has.
+        """
+        return len(self._moves)
+
+    def position_at(self, ply):
+        """
+        This method returns a new HasamiShogiGame in the position after the first PLY moves (0 is the starting
+        position). Negative numbers count back from the end of the game.
+        """
+        if ply < 0:
+            ply += len(self._moves) + 1
+        if not 0 <= ply <= len(self._moves):
+            raise IndexError("ply out of range")
+
+        game = HasamiShogiGame(self._bitboard, self._size)
+        game._set_position(self._snapshots[ply // self._interval])
+        for start, end in self._moves[ply - ply % self._interval:ply]:
+            game._apply(start, end)
+        return game
+
+
+class TranspositionTable:
+    """
+    This class is a fixed-size cache of results keyed by Zobrist hash, so positions reached through different move
+    orders are only worked out once. It never holds more than MAX_ENTRIES results; when two positions land in the
+    same place one of them is replaced.
+    """
+
+    def __init__(self, max_entries=1 << 16, policy="depth"):
+        """
+        This init method sets aside room for MAX_ENTRIES results. With the "depth" POLICY each bucket holds two
+        entries, one that is only replaced by a result searched at least as deeply and one that is always replaced.
+        With the "always" POLICY every bucket holds a single entry and the newest result always wins.
+        """
+        if policy not in ("depth", "always"):
+            raise ValueError("policy must be 'depth' or 'always'")
+        if max_entries < 2:
+            raise ValueError("max_entries must be at least 2")
+
+        self._policy = policy
+        self._slots = 2 if policy == "depth" else 1
+        self._buckets = max_entries // self._slots
+        self._entries = [None] * (self._buckets * self._slots)
+        self._used = 0
+        self._probes = 0
+        self._hits = 0
+        self._replaced = 0
+
+    def __len__(self):
+        """
+        This method returns how many entries are currently filled.
+        """
+        return self._used
+
+    def probe(self, key):
+        """
+        This method returns the (key, depth, value, flag, move) entry stored for KEY, or None if there isn't one.
+        """
+        self._probes += 1
+        index = key % self._buckets * self._slots
+        entry = self._entries[index]
+        if entry is not None and entry[0] == key:
+            self._hits += 1
+            return entry
+        if self._slots == 2:
+            entry = self._entries[index + 1]
+            if entry is not None and entry[0] == key:
+                self._hits += 1
+                return entry
+        return None
+
+    def store(self, key, depth, value, flag=None, move=None):
+        """
+        This method saves VALUE for the position KEY along with the DEPTH it was searched to. FLAG and MOVE are kept
+        as given for the caller, such as whether VALUE is exact or a bound and which move was best.
+        """
+        index = key % self._buckets * self._slots
+        entry = (key, depth, value, flag, move)
+
+        if self._slots == 2:
+            preferred = self._entries[index]
+            if preferred is None or preferred[0] == key or depth >= preferred[1]:
+                # Bumps the old deep entry into the always-replace slot instead of losing it
+                if preferred is not None and preferred[0] != key:
+                    self._put(index + 1, preferred)
+                    self._entries[index] = entry
+                    return
+                self._put(index, entry)
+                return
+            index += 1
+        self._put(index, entry)
+
+    def _put(self, index, entry):
+        """
+        This method writes ENTRY into slot INDEX and keeps the fill and replacement counts.
+        """
+        old = self._entries[index]
+        if old is None:
+            self._used += 1
+        elif old[0] != entry[0]:
+            self._replaced += 1
+        self._entries[index] = entry
+
+    def clear(self):
+        """
+        This method empties the table without changing its size.
+        """
+        self._entries = [None] * len(self._entries)
+        self._used = 0
+
+    def get_stats(self):
+        """
+        This method returns a dictionary with the table's capacity, filled entries, probes, hits and replacements.
+        """
+        return {"capacity": len(self._entries), "entries": self._used, "probes": self._probes, "hits": self._hits,
+                "replaced": self._replaced}
+
+
+class _BoardTables:
+    """
+    This class holds the tables that the boards and move generator look up instead of recomputing: square names,
+    Zobrist keys, the squares between any two squares on a line, the four rays leaving each square, which squares
+    touch each square, and which pieces take part in each corner capture.
+    """
+
+    def __init__(self, size):
+        """
+        This init method builds every table for a SIZE by SIZE board. It is run once per board size, by _get_tables.
+        """
+        self.size = size
+        self.win_captures = size - 1  # A side wins once the other is down to one piece
+        self.full = (1 << size * size) - 1
+        self.first_row = (1 << size) - 1
+        self.last_row = self.first_row << size * (size - 1)
+        self.first_column = 0
+        for row in range(size):
+            self.first_column |= 1 << row * size
+        self.last_column = self.first_column << size - 1
+        self.column_labels = tuple(str(column + 1) for column in range(size))
+        self.label_width = len(self.column_labels[-1])  # Printed boards pad every cell to this width
+        self.names = tuple(chr(ord("a") + row) + self.column_labels[column] for row in range(size)
+                           for column in range(size))
+        self.indexes = {name: index for index, name in enumerate(self.names)}
+        self.bits = tuple(1 << square for square in range(size * size))
+
+        # Zobrist keys come from a fixed seed so every process agrees on the hash of a position
+        keys = random.Random(size)
+        self.zobrist_black = tuple(keys.getrandbits(64) for _ in range(size * size))
+        self.zobrist_red = tuple(keys.getrandbits(64) for _ in range(size * size))
+        self.zobrist_turn = keys.getrandbits(64)
+        self.opening_hash = 0
+        for square in range(size):
+            self.opening_hash ^= self.zobrist_red[square] ^ self.zobrist_black[size * (size - 1) + square]
+
+        # between[start][end] holds the squares after START up to and including END, or None off the same line
+        self.between = []
+        self.adjacent = []
+        self.rays = []
+        for start in range(size * size):
+            start_row, start_column = divmod(start, size)
+            neighbours = 0
+            for row, column in ((start_row - 1, start_column), (start_row + 1, start_column),
+                                (start_row, start_column - 1), (start_row, start_column + 1)):
+                if 0 <= row < size and 0 <= column < size:
+                    neighbours |= 1 << row * size + column
+            self.adjacent.append(neighbours)
+
+            # rays[start] lists the squares walked outwards from START going up, down, left and right
+            self.rays.append((tuple(range(start - size, -1, -size)),
+                              tuple(range(start + size, size * size, size)),
+                              tuple(range(start - 1, start - start_column - 1, -1)),
+                              tuple(range(start + 1, start - start_column + size))))
+
+            # Each ray's between masks grow by one square at a time, so they are built walking out along it
+            masks = [None] * (size * size)
+            for ray in self.rays[start]:
+                mask = 0
+                for end in ray:
+                    mask |= 1 << end
+                    masks[end] = mask
+            self.between.append(masks)
+
+        # corners[end] is (corner bit, other side bit) when landing on END can take that corner
+        self.corners = {}
+        last = size - 1
+        for corner, first_side, second_side in (((0, 0), (0, 1), (1, 0)),
+                                                ((last, 0), (last, 1), (last - 1, 0)),
+                                                ((0, last), (0, last - 1), (1, last)),
+                                                ((last, last), (last - 1, last), (last, last - 1))):
+            corner_bit = 1 << corner[0] * size + corner[1]
+            first_index = first_side[0] * size + first_side[1]
+            second_index = second_side[0] * size + second_side[1]
+            self.corners[first_index] = (corner_bit, 1 << second_index)
+            self.corners[second_index] = (corner_bit, 1 << first_index)
+
+        # lines[square] is SQUARE's row and column. Whether a piece can reach a square, and what landing there takes,
+        # depends only on those squares and, next to a corner, on the corner check's other side square, so
+        # corner_readers[square] lists the landing squares whose corner check looks at SQUARE.
+        self.lines = tuple(self.first_row << row * size | self.first_column << column
+                           for row, column in (divmod(square, size) for square in range(size * size)))
+        self.corner_readers = [0] * (size * size)
+        for end, (_, partner_bit) in self.corners.items():
+            self.corner_readers[partner_bit.bit_length() - 1] |= 1 << end
+
+    def __deepcopy__(self, memo):
+        """
+        This method keeps deep copies of a game pointing at the shared tables, since they never change.
+        """
+        return self
+
+    def __reduce__(self):
+        """
+        This method pickles the tables as just their board size, so they are rebuilt (or reused) on loading.
+        """
+        return _get_tables, (self.size,)
+
+    def captures(self, own, opponent, end, stats=None):
+        """
+        This method returns the mask of OPPONENT pieces taken when OWN (which already includes the moved piece)
+        lands on END. Each direction shifts one square at a time while it is still on an enemy piece, and the run
+        is only taken if the square after it holds one of OWN's pieces. STATS, if given, is the make_move
+        instrumentation's timer: each scan reports its time and the squares it walked, and the corner check its time.
+        """
+        captured = 0
+        end_bit = 1 << end
+        if stats is not None:
+            started = time.perf_counter_ns()
+
+        if self.adjacent[end] & opponent:
+            size = self.size
+
+            run = 0  # capturing upwards
+            square = end_bit >> size
+            while square & opponent:
+                run |= square
+                square >>= size
+            if run and square & own:
+                captured |= run
+            if stats is not None:
+                started = stats("capture_up", started, bin(run).count("1") + bool(square & self.full))
+
+            run = 0  # capturing downwards
+            square = end_bit << size
+            while square & opponent:
+                run |= square
+                square <<= size
+            if run and square & own:
+                captured |= run
+            if stats is not None:
+                started = stats("capture_down", started, bin(run).count("1") + bool(square & self.full))
+
+            not_first = ~self.first_column
+            run = 0  # capturing left
+            square = (end_bit & not_first) >> 1
+            while square & opponent:
+                run |= square
+                square = (square & not_first) >> 1
+            if run and square & own:
+                captured |= run
+            if stats is not None:
+                started = stats("capture_left", started, bin(run).count("1") + bool(square & self.full))
+
+            not_last = ~self.last_column
+            run = 0  # capturing right
+            square = (end_bit & not_last) << 1
+            while square & opponent:
+                run |= square
+                square = (square & not_last) << 1
+            if run and square & own:
+                captured |= run
+            if stats is not None:
+                started = stats("capture_right", started, bin(run).count("1") + bool(square & self.full))
+
+        # Corner capture checks
+        corner = self.corners.get(end)
+        if corner is not None and opponent & corner[0] and own & corner[1]:
+            captured |= corner[0]
+        if stats is not None:
+            stats("corner", started)
+        return captured
+
+
+def _get_tables(size):
+    """
+    This function returns the _BoardTables for a SIZE by SIZE board, building them the first time a size is used so
+    every game on that size shares one set. A size below 4 (where the corner rules overlap) or above 26 (past the
+    last row letter) raises a ValueError.
+    """
+    tables = _TABLES_BY_SIZE.get(size)
+    if tables is None:
+        if not isinstance(size, int) or not 4 <= size <= 26:
+            raise ValueError("board size must be from 4 to 26")
+        tables = _TABLES_BY_SIZE[size] = _BoardTables(size)
+    return tables
+
+
+_TABLES_BY_SIZE = {}
+_TABLES = _get_tables(_BOARD_SIZE)
@@ -0,0 +1,368 @@
+# Description: A computer opponent for HasamiShogiGame. It runs an iterative-deepening alpha-beta search with a
+# transposition table and move ordering (captures first, killer moves, history heuristic) and always answers within
+# the time it is given.
+
+import time
+
+from HasamiShogiBoardGame import TranspositionTable
+
+_WIN_SCORE = 100000
+_MATE_BOUND = _WIN_SCORE - 1000
+_PIECE_SCORE = 100
+_QUIESCENCE_PLIES = 8
+
+_EXACT = 0
+_LOWER_BOUND = 1
+_UPPER_BOUND = 2
+
+
+class _SearchTimeout(Exception):
+    """
+    This exception unwinds the search when the deadline passes in the middle of a depth.
+    """
+
+
+class HasamiShogiEngine:
+    """
+    This class picks moves for whichever player's turn it is in a HasamiShogiGame. Moves are tried with the game's
+    own push_move and pop_move, so the capture rules in make_move decide what every searched move does.
+    """
+
+    def __init__(self, game, table_entries=1 << 18, tablebase=None):
+        """
+        This init method attaches the engine to GAME and sets up a transposition table with room for TABLE_ENTRIES
+        positions. The table, killer moves and history scores are kept between calls so later searches start warm.
+        TABLEBASE, a HasamiShogiTablebase, gives exact scores for the endings it covers instead of searching them.
+        Every table the search reads comes from GAME, so the engine plays on whatever board size GAME uses.
+        """
+        self._game = game
+        self._tables = game._tables
+        self._table = TranspositionTable(table_entries)
+        self._tablebase = tablebase
+
+        # Positions with fewer pieces captured than this can't be in any of the tablebase's tables
+        self._tablebase_captured = 2 * self._tables.size
+        if tablebase is not None:
+            self._tablebase_captured = min(2 * self._tables.size - mover - other
+                                           for mover, other in tablebase.get_signatures())
+        self._history = [0] * (len(self._tables.names) * len(self._tables.names))
+        self._killers = []
+        self._search_game = None
+        self._deadline = 0.0
+        self._nodes = 0
+        self._stats = {"depth": 0, "nodes": 0, "elapsed_ms": 0.0, "nodes_per_second": 0, "score": 0, "move": None}
+
+    def best_move(self, time_ms=1000, max_depth=64):
+        """
+        This method searches the game's current position one depth at a time until TIME_MS milliseconds have
+        passed (or MAX_DEPTH is reached) and returns the best move of the deepest finished depth as a (start, end)
+        pair such as ("i3", "d3"). The deadline is checked while searching, so a depth that runs out of time is
+        abandoned rather than allowed to overrun. It returns None if the side to move has no moves.
+        """
+        started = time.perf_counter()
+        self._deadline = started + time_ms / 1000
+        self._nodes = 0
+        self._search_game = self._game.copy(bitboard=True)
+
+        moves = self._order_moves(None, 0)
+        if not moves:
+            self._set_stats(0, started, 0, None)
+            return None
+
+        best_move = moves[0]
+        best_score = 0
+        depth_reached = 0
+        for depth in range(1, max_depth + 1):
+            try:
+                score, move = self._search_root(depth)
+            except _SearchTimeout:
+                break
+
+            best_score, best_move, depth_reached = score, move, depth
+
+            # Stops early once a forced win or loss is found, or when the next depth is unlikely to finish
+            if abs(score) >= _MATE_BOUND:
+                break
+            if time.perf_counter() - started > (self._deadline - started) / 2:
+                break
+
+        self._set_stats(depth_reached, started, best_score, best_move)
+        return self._tables.names[best_move[0]], self._tables.names[best_move[1]]
+
+    def get_search_stats(self):
+        """
+        This method returns a dictionary describing the last best_move call: the deepest finished depth, nodes
+        searched, elapsed milliseconds, nodes per second, the score of the chosen move (in hundredths of a piece, from
+        the mover's side) and the move itself. It also includes the transposition table's counters.
+        """
+        stats = dict(self._stats)
+        stats["table"] = self._table.get_stats()
+        return stats
+
+    def _set_stats(self, depth, started, score, move):
+        """
+        This method records the results of a search for get_search_stats.
+        """
+        elapsed = time.perf_counter() - started
+        self._stats = {"depth": depth, "nodes": self._nodes, "elapsed_ms": elapsed * 1000,
+                       "nodes_per_second": int(self._nodes / elapsed) if elapsed > 0 else 0, "score": score,
+                       "move": None if move is None else (self._tables.names[move[0]], self._tables.names[move[1]])}
+
+    def _search_root(self, depth):
+        """
+        This method searches every move at the root to DEPTH and returns the best (score, move) pair.
+        """
+        game = self._search_game
+        entry = self._table.probe(game._hash)
+        moves = self._order_moves(entry[4] if entry is not None else None, 0)
+
+        alpha = -_WIN_SCORE - 1
+        beta = _WIN_SCORE + 1
+        best_move = moves[0]
+        for move in moves:
+            game._push(move[0], move[1])
+            score = -self._search(depth - 1, -beta, -alpha, 1)
+            game.pop_move()
+            if score > alpha:
+                alpha = score
+                best_move = move
+
+        self._table.store(game._hash, depth, alpha, _EXACT, best_move)
+        return alpha, best_move
+
+    def _search(self, depth, alpha, beta, ply):
+        """
+        This method is the negamax alpha-beta search. It returns the score of the position for the side to move.
+        """
+        self._nodes += 1
+        if not self._nodes & 63 and time.perf_counter() >= self._deadline:
+            raise _SearchTimeout()
+
+        game = self._search_game
+        if game._game_winner != "UNFINISHED":
+            return -_WIN_SCORE + ply  # The player who just moved has won
+        if self._tablebase is not None \
+                and game._player_red_captured + game._player_black_captured >= self._tablebase_captured:
+            known = self._tablebase.probe(game)
+            if known is not None:
+                return _tablebase_score(known, ply)
+        if depth <= 0:
+            return self._quiesce(alpha, beta, ply, _QUIESCENCE_PLIES)
+
+        key = game._hash
+        entry = self._table.probe(key)
+        table_move = None
+        if entry is not None:
+            table_move = entry[4]
+            if entry[1] >= depth:
+                value = _from_table(entry[2], ply)
+                if entry[3] == _EXACT:
+                    return value
+                if entry[3] == _LOWER_BOUND and value >= beta:
+                    return value
+                if entry[3] == _UPPER_BOUND and value <= alpha:
+                    return value
+
+        moves = self._order_moves(table_move, ply)
+        if not moves:
+            return self._evaluate()
+
+        original_alpha = alpha
+        best_score = -_WIN_SCORE - 1
+        best_move = None
+        for move in moves:
+            game._push(move[0], move[1])
+            score = -self._search(depth - 1, -beta, -alpha, ply + 1)
+            captured = game._move_stack[-1][6]
+            game.pop_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                # Quiet moves that cause a cutoff are remembered as killers and in the history table
+                if not captured:
+                    killers = self._killers[ply]
+                    if killers[0] != move:
+                        killers[1] = killers[0]
+                        killers[0] = move
+                    self._history[move[0] * len(self._tables.names) + move[1]] += depth * depth
+                break
+
+        if best_score <= original_alpha:
+            flag = _UPPER_BOUND
+        elif best_score >= beta:
+            flag = _LOWER_BOUND
+        else:
+            flag = _EXACT
+        self._table.store(key, depth, _to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiesce(self, alpha, beta, ply, plies_left):
+        """
+        This method keeps searching capturing moves past the normal depth so a position is never scored in the
+        middle of an exchange.
+        """
+        self._nodes += 1
+        if not self._nodes & 63 and time.perf_counter() >= self._deadline:
+            raise _SearchTimeout()
+
+        game = self._search_game
+        if game._game_winner != "UNFINISHED":
+            return -_WIN_SCORE + ply
+
+        stand_pat = self._evaluate()
+        if stand_pat >= beta or plies_left <= 0:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in self._capture_moves():
+            game._push(move[0], move[1])
+            score = -self._quiesce(-beta, -alpha, ply + 1, plies_left - 1)
+            game.pop_move()
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def _evaluate(self):
+        """
+        This method scores the position by material from the point of view of the side to move.
+        """
+        game = self._search_game
+        score = (game._player_red_captured - game._player_black_captured) * _PIECE_SCORE
+        if game._player_turn == "RED":
+            return -score
+        return score
+
+    def _order_moves(self, table_move, ply):
+        """
+        This method returns the side to move's moves as (start, end) index pairs, best first: the transposition
+        table move, then captures (largest first), then the two killer moves for PLY, then the rest by history score.
+        """
+        game = self._search_game
+        while len(self._killers) <= ply:
+            self._killers.append([None, None])
+        killers = self._killers[ply]
+
+        color = game._player_turn
+        capture_counts = self._capture_counts()
+        history = self._history
+        squares = len(self._tables.names)
+
+        scored = []
+        for start, end in game._generate_moves(color):
+            move = (start, end)
+            if move == table_move:
+                score = 1 << 40
+            else:
+                captured = capture_counts.get(move)
+                if captured:
+                    score = (1 << 32) + captured
+                elif move == killers[0]:
+                    score = 1 << 31
+                elif move == killers[1]:
+                    score = 1 << 30
+                else:
+                    score = history[start * squares + end]
+            scored.append((score, move))
+        scored.sort(key=_first, reverse=True)
+        return [move for _, move in scored]
+
+    def _capture_moves(self):
+        """
+        This method returns only the side to move's capturing moves, the ones taking the most pieces first.
+        """
+        scored = [(count, move) for move, count in self._capture_counts().items()]
+        scored.sort(key=_first, reverse=True)
+        return [move for _, move in scored]
+
+    def _capture_counts(self):
+        """
+        This method returns a dictionary from each of the side to move's capturing moves to how many pieces it takes.
+        A move can only capture by landing beside an enemy piece or on a corner check's side square, so rather than
+        trying every move it walks outwards from those empty squares and tries just the first piece met on each ray.
+        That keeps the work tied to the enemy pieces instead of to how far pieces can slide on a big board.
+        """
+        game = self._search_game
+        black, red = game._board.get_masks()
+        own, opponent = (black, red) if game._player_turn == "BLACK" else (red, black)
+        occupied = black | red
+        tables = self._tables
+        bits = tables.bits
+        captures = tables.captures
+        adjacent = tables.adjacent
+        rays = tables.rays
+
+        targets = 0
+        pieces = opponent
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            targets |= adjacent[low.bit_length() - 1]
+        for end, (corner_bit, _) in tables.corners.items():
+            if opponent & corner_bit:
+                targets |= bits[end]
+        targets &= ~occupied
+
+        counts = {}
+        while targets:
+            low = targets & -targets
+            targets ^= low
+            end = low.bit_length() - 1
+            for ray in rays[end]:
+                for start in ray:
+                    bit = bits[start]
+                    if occupied & bit:
+                        if own & bit:
+                            captured = captures(own ^ bit ^ low, opponent, end)
+                            if captured:
+                                counts[(start, end)] = bin(captured).count("1")
+                        break
+        return counts
+
+
+def _first(item):
+    """
+    This function is the sort key for (score, move) pairs.
+    """
+    return item[0]
+
+
+def _tablebase_score(known, ply):
+    """
+    This function turns a tablebase result into a search score, counting the plies to the winning capture the same
+    way as a win found by searching.
+    """
+    result, plies = known
+    if result == "WIN":
+        return _WIN_SCORE - ply - plies
+    if result == "LOSS":
+        return -_WIN_SCORE + ply + plies
+    return 0
+
+
+def _to_table(score, ply):
+    """
+    This function turns a win or loss score into distance from the stored position before it goes in the table.
+    """
+    if score >= _MATE_BOUND:
+        return score + ply
+    if score <= -_MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _from_table(score, ply):
+    """
+    This function turns a stored win or loss score back into distance from the root.
+    """
+    if score >= _MATE_BOUND:
+        return score - ply
+    if score <= -_MATE_BOUND:
+        return score + ply
+    return score
@@ -0,0 +1,357 @@
+# Description: A Monte Carlo Tree Search player for HasamiShogiGame. The tree lives in the main process and is kept
+# from one move to the next, while random playouts are handed out in batches to a pool of worker processes.
+
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from HasamiShogiBoardGame import _get_tables
+
+_MAX_ROLLOUT_PLIES = 80
+_PICK_ATTEMPTS = 16
+
+
+class _Node:
+    """
+    This class is one position in the search tree, reached by playing MOVE from its parent. SCORE counts wins for
+    the player who made MOVE, so a parent picks the child that is best for the player choosing.
+    """
+
+    __slots__ = ("move", "parent", "children", "untried", "visits", "score", "color", "hash", "winner")
+
+    def __init__(self, move, parent, color, position_hash, winner):
+        """
+        This init method creates an unvisited node. Its moves are only generated the first time it is reached.
+        """
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = None
+        self.visits = 0
+        self.score = 0.0
+        self.color = color
+        self.hash = position_hash
+        self.winner = winner
+
+
+class HasamiShogiMCTS:
+    """
+    This class picks moves for whichever player's turn it is in a HasamiShogiGame using Monte Carlo Tree Search.
+    Leaves are chosen a batch at a time, using a virtual loss so one batch spreads over different lines, and the
+    batch's playouts are split across WORKERS processes (leaf parallelism). The tree is kept between calls, so the
+    part of it that follows the moves actually played is reused.
+    """
+
+    def __init__(self, game, workers=None, batch_size=None, rollouts_per_leaf=2, exploration=1.4, seed=None):
+        """
+        This init method attaches the player to GAME. WORKERS defaults to every core on the machine and 0 runs
+        playouts in this process. BATCH_SIZE is how many leaves are chosen before playouts are sent out (by default
+        8 per worker) and each leaf gets ROLLOUTS_PER_LEAF random playouts.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self._game = game
+        self._workers = workers
+        self._batch_size = batch_size or 8 * max(1, workers)
+        self._rollouts_per_leaf = rollouts_per_leaf
+        self._exploration = exploration
+        self._random = random.Random(seed)
+        self._pool = None
+        self._root = None
+        self._search_game = None
+        self._stats = {"playouts": 0, "playouts_per_second": 0, "elapsed_ms": 0.0, "root_visits": 0,
+                       "reused_visits": 0, "workers": workers, "move": None}
+
+    def __enter__(self):
+        """
+        This method lets the player be used in a with statement so its worker processes are always shut down.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        This method shuts down the worker processes at the end of a with statement.
+        """
+        self.close()
+
+    def close(self):
+        """
+        This method shuts down the worker processes. The player can still be used afterwards; a new pool is started
+        the next time one is needed.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def best_move(self, time_ms=1000):
+        """
+        This method grows the tree for TIME_MS milliseconds and returns the most visited move as a (start, end)
+        pair such as ("i3", "d3"), or None if the side to move has no moves.
+        """
+        started = time.perf_counter()
+        deadline = started + time_ms / 1000
+        self._search_game = self._game.copy(bitboard=True)
+        self._root = self._find_root()
+        reused = self._root.visits
+        playouts = 0
+
+        if self._workers > 0 and self._pool is None:
+            self._pool = ProcessPoolExecutor(self._workers)
+
+        while time.perf_counter() < deadline:
+            leaves = []
+            for _ in range(self._batch_size):
+                leaf = self._select()
+                if leaf is None:
+                    break
+                leaves.append(leaf)
+            if not leaves:
+                break  # Every line has been played out to the end
+
+            results = self._run_playouts([state for _, state in leaves])
+            for (node, _), (total, count) in zip(leaves, results):
+                self._backpropagate(node, total, count)
+                playouts += count
+
+        names = self._game._tables.names
+        best = None
+        if self._root.children:
+            best = max(self._root.children, key=_visit_count).move
+
+        elapsed = time.perf_counter() - started
+        self._stats = {"playouts": playouts, "playouts_per_second": int(playouts / elapsed) if elapsed > 0 else 0,
+                       "elapsed_ms": elapsed * 1000, "root_visits": self._root.visits, "reused_visits": reused,
+                       "workers": self._workers,
+                       "move": None if best is None else (names[best[0]], names[best[1]])}
+        return self._stats["move"]
+
+    def get_search_stats(self):
+        """
+        This method returns a dictionary describing the last best_move call, including playouts per second and how
+        many root visits were carried over from the previous tree.
+        """
+        return dict(self._stats)
+
+    def _find_root(self):
+        """
+        This method looks for the game's current position among the old root, its children and its grandchildren
+        (our move and the reply), and makes that node the new root so its statistics are kept. Otherwise it starts
+        a fresh tree.
+        """
+        game = self._search_game
+        key = game.get_zobrist_hash()
+        if self._root is not None:
+            candidates = [self._root]
+            for child in self._root.children:
+                candidates.append(child)
+                candidates.extend(child.children)
+            for node in candidates:
+                if node.hash == key and node.winner == game.get_game_state():
+                    node.parent = None
+                    return node
+
+        mover = "RED" if game.get_active_player() == "BLACK" else "BLACK"
+        return _Node(None, None, mover, key, game.get_game_state())
+
+    def _select(self):
+        """
+        This method walks down the tree by UCT, adds one new child and returns it with the state to play out from.
+        Every node on the way counts one pending visit (the virtual loss) until its playouts come back. It returns
+        None when the whole tree is finished games.
+        """
+        game = self._search_game
+        node = self._root
+        depth = 0
+        log = math.log
+        sqrt = math.sqrt
+        exploration = self._exploration
+
+        while True:
+            node.visits += 1
+            if node.winner != "UNFINISHED":
+                break
+            if node.untried is None:
+                node.untried = list(game._generate_moves(game.get_active_player()))
+                self._random.shuffle(node.untried)
+
+            if node.untried:
+                move = node.untried.pop()
+                mover = game.get_active_player()
+                game._push(move[0], move[1])
+                depth += 1
+                child = _Node(move, node, mover, game.get_zobrist_hash(), game.get_game_state())
+                node.children.append(child)
+                node = child
+                node.visits += 1
+                break
+
+            if not node.children:
+                break  # The side to move is stuck
+
+            parent_log = log(node.visits)
+            best = None
+            best_value = -1.0
+            for child in node.children:
+                if child.visits:
+                    value = child.score / child.visits + exploration * sqrt(parent_log / child.visits)
+                else:
+                    value = float("inf")
+                if value > best_value:
+                    best_value = value
+                    best = child
+            node = best
+            game._push(node.move[0], node.move[1])
+            depth += 1
+
+        black, red = game._board.get_masks()
+        state = (black, red, game.get_active_player() == "BLACK", game.get_num_captured_pieces("RED"),
+                 game.get_num_captured_pieces("BLACK"), game.get_game_state())
+        for _ in range(depth):
+            game.pop_move()
+
+        if node is self._root and node.winner != "UNFINISHED":
+            node.visits -= 1
+            return None
+        return node, state
+
+    def _run_playouts(self, states):
+        """
+        This method plays out every state and returns one (black wins, playouts) pair per state. With workers the
+        states are split into one chunk per worker.
+        """
+        rollouts = self._rollouts_per_leaf
+        size = self._game._tables.size
+        if self._pool is None:
+            return _run_rollouts(states, rollouts, self._random.getrandbits(64), size)
+
+        chunk = -(-len(states) // self._workers)
+        futures = [self._pool.submit(_run_rollouts, states[i:i + chunk], rollouts, self._random.getrandbits(64), size)
+                   for i in range(0, len(states), chunk)]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def _backpropagate(self, node, black_wins, count):
+        """
+        This method adds the playout results to NODE and every node above it. One visit per node was already added
+        during selection, so only COUNT - 1 more are added here.
+        """
+        while node is not None:
+            node.visits += count - 1
+            if node.color == "BLACK":
+                node.score += black_wins
+            else:
+                node.score += count - black_wins
+            node = node.parent
+
+
+def _visit_count(node):
+    """
+    This function is the key used to pick the most visited child.
+    """
+    return node.visits
+
+
+def _run_rollouts(states, rollouts, seed, size):
+    """
+    This function plays ROLLOUTS random games from each state on a SIZE by SIZE board and returns a (black wins,
+    playouts) pair for each. It runs in the worker processes, so it only takes and returns plain numbers.
+    """
+    tables = _get_tables(size)
+    rng = random.Random(seed)
+    results = []
+    for black, red, black_to_move, red_captured, black_captured, winner in states:
+        if winner == "BLACK_WON":
+            results.append((float(rollouts), rollouts))
+        elif winner == "RED_WON":
+            results.append((0.0, rollouts))
+        else:
+            total = 0.0
+            for _ in range(rollouts):
+                total += _rollout(black, red, black_to_move, red_captured, black_captured, rng, tables)
+            results.append((total, rollouts))
+    return results
+
+
+def _rollout(black, red, black_to_move, red_captured, black_captured, rng, tables):
+    """
+    This function plays random moves straight on the occupancy masks, with the same capture rules as BitShogiBoard
+    and the board TABLES, until someone wins or _MAX_ROLLOUT_PLIES moves have been made. It returns 1 for a Black
+    win, 0 for a Red win and 0.5 otherwise, with an unfinished game going to whoever has captured more.
+
+    Rather than listing every move, each ply picks a random piece and direction and then a random distance along
+    that ray, which is close to uniform and much cheaper. Only when that keeps hitting blocked pieces are all the
+    moves listed.
+    """
+    rays = tables.rays
+    bits = tables.bits
+    captures = tables.captures
+    win_captures = tables.win_captures
+    random_number = rng.random
+
+    for _ in range(_MAX_ROLLOUT_PLIES):
+        if black_to_move:
+            own, opponent = black, red
+        else:
+            own, opponent = red, black
+        occupied = black | red
+
+        pieces = []
+        remaining = own
+        while remaining:
+            low = remaining & -remaining
+            remaining ^= low
+            pieces.append(low.bit_length() - 1)
+
+        start = end = None
+        for _ in range(_PICK_ATTEMPTS):
+            start = pieces[int(random_number() * len(pieces))]
+            ray = rays[start][int(random_number() * 4)]
+            free = 0
+            for square in ray:
+                if occupied & bits[square]:
+                    break
+                free += 1
+            if free:
+                end = ray[int(random_number() * free)]
+                break
+
+        if end is None:
+            moves = []
+            for start in pieces:
+                for ray in rays[start]:
+                    for square in ray:
+                        if occupied & bits[square]:
+                            break
+                        moves.append((start, square))
+            if not moves:
+                return 0.5
+            start, end = moves[int(random_number() * len(moves))]
+
+        own ^= bits[start] | bits[end]
+        taken = captures(own, opponent, end)
+        if taken:
+            opponent ^= taken
+            if black_to_move:
+                red_captured += bin(taken).count("1")
+                if red_captured >= win_captures:
+                    return 1.0
+            else:
+                black_captured += bin(taken).count("1")
+                if black_captured >= win_captures:
+                    return 0.0
+
+        if black_to_move:
+            black, red = own, opponent
+        else:
+            black, red = opponent, own
+        black_to_move = not black_to_move
+
+    if red_captured > black_captured:
+        return 1.0
+    if black_captured > red_captured:
+        return 0.0
+    return 0.5
@@ -0,0 +1,225 @@
+# Description: A compact binary format for Hasami Shogi game records and an append-only game database built from it.
+# The database is read through mmap with a fixed-width offset index, so game number N is found without reading any of
+# the games before it.
+
+import mmap
+import struct
+
+from HasamiShogiBoardGame import _TABLES
+
+_STATES = ("UNFINISHED", "BLACK_WON", "RED_WON")
+_STATE_CODES = {state: code for code, state in enumerate(_STATES)}
+
+_HAS_CAPTURES = 1
+
+# Each record is a header (move count, flags, result) followed by two bytes per move, then the capture bitmap
+_RECORD_HEADER = struct.Struct("<HBB")
+_OFFSET = struct.Struct("<Q")
+
+_DATA_MAGIC = b"HSGDATA1"
+_INDEX_MAGIC = b"HSGINDX1"
+
+
+def encode_game(moves, captures=None, state="UNFINISHED"):
+    """
+    This function packs a game into bytes. Each square is one byte (its index, row * 9 + column counting from zero)
+    and each move is two bytes, start then end. CAPTURES, if given, has one entry per move that is true (or a
+    nonzero count) when that move captured something and is stored as a bitmap of one bit per move.
+    """
+    body = bytearray(2 * len(moves))
+    for number, (start, end) in enumerate(moves):
+        body[2 * number] = _TABLES.indexes[start]
+        body[2 * number + 1] = _TABLES.indexes[end]
+
+    flags = 0
+    if captures is not None:
+        flags |= _HAS_CAPTURES
+        bitmap = bytearray((len(moves) + 7) // 8)
+        for number, captured in enumerate(captures):
+            if captured:
+                bitmap[number >> 3] |= 1 << (number & 7)
+        body += bitmap
+
+    return _RECORD_HEADER.pack(len(moves), flags, _STATE_CODES[state]) + bytes(body)
+
+
+def decode_game(data, offset=0):
+    """
+    This function unpacks the record starting at OFFSET in DATA (bytes, or anything that slices like it such as an
+    mmap) and returns a dictionary with the "moves" as (start, end) square pairs, "captured" as one true/false per
+    move (or None if the record has no capture bitmap) and the final "state".
+    """
+    count, flags, state = _RECORD_HEADER.unpack_from(data, offset)
+    offset += _RECORD_HEADER.size
+    squares = data[offset:offset + 2 * count]
+    names = _TABLES.names
+    moves = [(names[squares[number]], names[squares[number + 1]]) for number in range(0, 2 * count, 2)]
+
+    captured = None
+    if flags & _HAS_CAPTURES:
+        bitmap = data[offset + 2 * count:offset + 2 * count + (count + 7) // 8]
+        captured = [bool(bitmap[number >> 3] >> (number & 7) & 1) for number in range(count)]
+    return {"moves": moves, "captured": captured, "state": _STATES[state]}
+
+
+def record_size(data, offset=0):
+    """
+    This function returns how many bytes the record starting at OFFSET takes up.
+    """
+    count, flags, _ = _RECORD_HEADER.unpack_from(data, offset)
+    size = _RECORD_HEADER.size + 2 * count
+    if flags & _HAS_CAPTURES:
+        size += (count + 7) // 8
+    return size
+
+
+class GameDatabaseWriter:
+    """
+    This class appends games to a database. The games go in the data file at PATH and the offset of each one goes in
+    PATH + ".idx", eight bytes per game. An existing database is added to, never rewritten.
+    """
+
+    def __init__(self, path):
+        """
+        This init method opens (or creates) the data and index files at PATH for appending. The headers of new
+        files are flushed straight away, so a GameDatabase can open the archive before any game is added.
+        """
+        self._data = open(path, "ab")
+        self._index = open(path + ".idx", "ab")
+        if self._data.tell() == 0:
+            self._data.write(_DATA_MAGIC)
+        if self._index.tell() == 0:
+            self._index.write(_INDEX_MAGIC)
+        self.flush()
+        self._count = (self._index.tell() - len(_INDEX_MAGIC)) // _OFFSET.size
+
+    def __enter__(self):
+        """
+        This method lets the writer be used in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        This method closes the files at the end of a with statement.
+        """
+        self.close()
+
+    def __len__(self):
+        """
+        This method returns how many games the database holds.
+        """
+        return self._count
+
+    def append(self, moves, captures=None, state="UNFINISHED"):
+        """
+        This method adds one game (see encode_game) and returns its game number. The record is written before its
+        offset, so a reader never finds an index entry for a half-written game.
+        """
+        offset = self._data.tell()
+        self._data.write(encode_game(moves, captures, state))
+        self._data.flush()
+        self._index.write(_OFFSET.pack(offset))
+        self._count += 1
+        return self._count - 1
+
+    def flush(self):
+        """
+        This method pushes any buffered writes out to the files.
+        """
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        """
+        This method flushes and closes both files.
+        """
+        self._data.close()
+        self._index.close()
+
+
+class GameDatabase:
+    """
+    This class reads a database written by GameDatabaseWriter. Both files are memory-mapped, so opening an archive
+    of any size reads nothing up front, and database[n] looks up one offset and decodes one record.
+    """
+
+    def __init__(self, path):
+        """
+        This init method maps the data and index files at PATH. Games appended after this are not seen until the
+        database is opened again.
+        """
+        self._data_file = open(path, "rb")
+        self._index_file = None
+        self._data = None
+        try:
+            self._index_file = open(path + ".idx", "rb")
+            self._data = mmap.mmap(self._data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Closes whatever was opened, since the caller never gets an object to close
+            for opened in (self._data, self._index_file, self._data_file):
+                if opened is not None:
+                    opened.close()
+            raise
+        if self._data[:len(_DATA_MAGIC)] != _DATA_MAGIC or self._index[:len(_INDEX_MAGIC)] != _INDEX_MAGIC:
+            self.close()
+            raise ValueError(path + " is not a Hasami Shogi game database")
+        self._count = (len(self._index) - len(_INDEX_MAGIC)) // _OFFSET.size
+
+    def __enter__(self):
+        """
+        This method lets the database be used in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        This method unmaps and closes the files at the end of a with statement.
+        """
+        self.close()
+
+    def __len__(self):
+        """
+        This method returns how many games the database holds.
+        """
+        return self._count
+
+    def __getitem__(self, number):
+        """
+        This method returns game NUMBER as decoded by decode_game. Negative numbers count from the end.
+        """
+        return decode_game(self._data, self.get_offset(number))
+
+    def __iter__(self):
+        """
+        This method yields every game in order.
+        """
+        for number in range(self._count):
+            yield self[number]
+
+    def get_offset(self, number):
+        """
+        This method returns where game NUMBER starts in the data file.
+        """
+        if number < 0:
+            number += self._count
+        if not 0 <= number < self._count:
+            raise IndexError("game number out of range")
+        return _OFFSET.unpack_from(self._index, len(_INDEX_MAGIC) + number * _OFFSET.size)[0]
+
+    def get_raw(self, number):
+        """
+        This method returns the encoded bytes of game NUMBER without decoding them.
+        """
+        offset = self.get_offset(number)
+        return self._data[offset:offset + record_size(self._data, offset)]
+
+    def close(self):
+        """
+        This method unmaps and closes both files.
+        """
+        self._data.close()
+        self._index.close()
+        self._data_file.close()
+        self._index_file.close()
@@ -0,0 +1,287 @@
+# Description: Plays many Hasami Shogi games at once across worker processes and streams each finished game to a
+# JSON Lines file or a binary game database. Run "python HasamiShogiSelfPlay.py --help" for the options.
+
+import argparse
+import json
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from HasamiShogiBoardGame import HasamiShogiGame
+from HasamiShogiEngine import HasamiShogiEngine
+from HasamiShogiRecords import GameDatabaseWriter
+
+
+class RandomPlayer:
+    """
+    This class plays a random legal move every turn.
+    """
+
+    def __init__(self, seed=None):
+        """
+        This init method seeds the player's random numbers with SEED so games can be replayed.
+        """
+        self._random = random.Random(seed)
+
+    def start_game(self, game):
+        """
+        This method is called once before the first move of GAME.
+        """
+
+    def choose_move(self, game, ply=None):
+        """
+        This method returns a random legal (start, end) move for the player to move, or None if there isn't one.
+        PLY, the number of moves played so far, is not needed.
+        """
+        moves = list(game.legal_moves(game.get_active_player()))
+        if not moves:
+            return None
+        return self._random.choice(moves)
+
+
+class EnginePlayer:
+    """
+    This class plays the move HasamiShogiEngine finds in TIME_MS milliseconds.
+    """
+
+    def __init__(self, time_ms=50, max_depth=64):
+        """
+        This init method sets how long each move may take and how deep the engine may search.
+        """
+        self._time_ms = time_ms
+        self._max_depth = max_depth
+        self._engine = None
+
+    def start_game(self, game):
+        """
+        This method gives each game a fresh engine so nothing learned in one game leaks into the next.
+        """
+        self._engine = HasamiShogiEngine(game)
+
+    def choose_move(self, game, ply=None):
+        """
+        This method returns the engine's move for the player to move.
+        """
+        return self._engine.best_move(time_ms=self._time_ms, max_depth=self._max_depth)
+
+
+class ScriptedPlayer:
+    """
+    This class plays the moves of a fixed script, such as an opening line, and then random moves once the script
+    runs out or its next move isn't legal. The script is shared by both colors and indexed by move number, so two
+    scripted players together replay it exactly.
+    """
+
+    def __init__(self, moves, seed=None):
+        """
+        This init method takes the script as a list of (start, end) moves.
+        """
+        self._moves = list(moves)
+        self._fallback = RandomPlayer(seed)
+
+    def start_game(self, game):
+        """
+        This method is called once before the first move of GAME.
+        """
+
+    def choose_move(self, game, ply=None):
+        """
+        This method returns the script's move for move number PLY if it is legal, and a random move otherwise.
+        """
+        if ply is not None and ply < len(self._moves):
+            move = tuple(self._moves[ply])
+            if move in set(game.legal_moves(game.get_active_player())):
+                return move
+        return self._fallback.choose_move(game)
+
+
+def read_script(path):
+    """
+    This function reads a script file with one move per line written as "start end" (such as "i3 d3"). Blank lines
+    and lines starting with # are skipped.
+    """
+    moves = []
+    with open(path) as script:
+        for line in script:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                start, end = line.split()
+                moves.append((start, end))
+    return moves
+
+
+def make_player(kind, seed, options):
+    """
+    This function builds a "random", "engine" or "scripted" player from the command-line OPTIONS.
+    """
+    if kind == "random":
+        return RandomPlayer(seed)
+    if kind == "engine":
+        return EnginePlayer(options["engine_time_ms"], options["engine_depth"])
+    if kind == "scripted":
+        return ScriptedPlayer(options["script"], seed)
+    raise ValueError("unknown player " + repr(kind))
+
+
+def play_game(black, red, max_plies=500, size=9):
+    """
+    This function plays one game between the BLACK and RED players on a SIZE by SIZE board and returns its record:
+    the moves, how many pieces each move captured (taken from the change in the capture counters) and the final game
+    state. A game that reaches MAX_PLIES moves, or where the player to move has no move, is stopped and left
+    "UNFINISHED".
+    """
+    game = HasamiShogiGame(True, size)
+    black.start_game(game)
+    red.start_game(game)
+    moves = []
+    captures = []
+
+    while game.get_game_state() == "UNFINISHED" and len(moves) < max_plies:
+        player = black if game.get_active_player() == "BLACK" else red
+        move = player.choose_move(game, len(moves))
+        if move is None:
+            break
+
+        before = game.get_num_captured_pieces("RED") + game.get_num_captured_pieces("BLACK")
+        if not game.make_move(move[0], move[1]):
+            raise RuntimeError("player chose an illegal move " + repr(move))
+        moves.append([move[0], move[1]])
+        captures.append(game.get_num_captured_pieces("RED") + game.get_num_captured_pieces("BLACK") - before)
+
+    return {"moves": moves, "captures": captures, "state": game.get_game_state(),
+            "red_captured": game.get_num_captured_pieces("RED"),
+            "black_captured": game.get_num_captured_pieces("BLACK")}
+
+
+def play_games(first_game, count, options):
+    """
+    This function plays games FIRST_GAME up to FIRST_GAME + COUNT in a worker process and returns their records.
+    Every game's random numbers are seeded from the base seed and its game number.
+    """
+    records = []
+    for number in range(first_game, first_game + count):
+        seed = options["seed"] * 1000003 + number
+        black = make_player(options["black"], seed * 2, options)
+        red = make_player(options["red"], seed * 2 + 1, options)
+        record = play_game(black, red, options["max_plies"], options["board_size"])
+        record["game"] = number
+        records.append(record)
+    return records
+
+
+def write_records(output, records):
+    """
+    This function writes one JSON line per record and flushes so finished games are on disk straight away.
+    """
+    for record in records:
+        output.write(json.dumps(record, separators=(",", ":")) + "\n")
+    output.flush()
+
+
+def append_records(database, records):
+    """
+    This function adds the records to a GameDatabaseWriter, keeping which moves captured as the capture bitmap.
+    """
+    for record in records:
+        database.append(record["moves"], record["captures"], record["state"])
+    database.flush()
+
+
+def run(options, write):
+    """
+    This function plays OPTIONS["games"] games across OPTIONS["workers"] processes in chunks of
+    OPTIONS["chunk_size"] games and passes each chunk's records to WRITE. Chunks are written in game order as soon
+    as every earlier chunk is done, so game N is always the Nth record written, however the workers finish. At most
+    two chunks per worker are running or waiting to be written, so memory stays flat however many games are played.
+    It returns a summary dictionary.
+    """
+    started = time.perf_counter()
+    total = options["games"]
+    chunk = options["chunk_size"]
+    workers = options["workers"]
+    summary = {"games": 0, "plies": 0, "BLACK_WON": 0, "RED_WON": 0, "UNFINISHED": 0}
+
+    def record_chunk(records):
+        write(records)
+        for record in records:
+            summary["games"] += 1
+            summary["plies"] += len(record["moves"])
+            summary[record["state"]] += 1
+
+    if workers <= 1:
+        for first in range(0, total, chunk):
+            record_chunk(play_games(first, min(chunk, total - first), options))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            # pending maps each running chunk to its first game; finished holds chunks waiting on an earlier one
+            pending = {}
+            finished = {}
+            next_game = 0
+            next_write = 0
+            while next_game < total or pending:
+                # Counts chunks that are finished but not yet written too, so a slow chunk can't let them pile up
+                while next_game < total and next_game - next_write < 2 * workers * chunk:
+                    pending[pool.submit(play_games, next_game, min(chunk, total - next_game), options)] = next_game
+                    next_game += chunk
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                while next_write in finished:
+                    record_chunk(finished.pop(next_write))
+                    next_write += chunk
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["games_per_second"] = round(summary["games"] / elapsed, 2) if elapsed > 0 else 0.0
+    return summary
+
+
+def main(argv=None):
+    """
+    This function is the command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Play Hasami Shogi games in parallel and save the game records.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=10, help="games per worker task and per write")
+    parser.add_argument("--black", choices=("random", "engine", "scripted"), default="random")
+    parser.add_argument("--red", choices=("random", "engine", "scripted"), default="random")
+    parser.add_argument("--script", help="move file for scripted players, one 'start end' move per line")
+    parser.add_argument("--engine-time-ms", type=int, default=50, help="thinking time per engine move")
+    parser.add_argument("--engine-depth", type=int, default=64, help="deepest engine search")
+    parser.add_argument("--max-plies", type=int, default=500, help="moves before a game is stopped unfinished")
+    parser.add_argument("--seed", type=int, default=0, help="base random seed")
+    parser.add_argument("--board-size", type=int, default=9, help="rows and columns, from 4 to 26 (jsonl only)")
+    parser.add_argument("--output", default="-", help="file to write, or - for standard output (jsonl only)")
+    parser.add_argument("--format", choices=("jsonl", "binary"), default="jsonl",
+                        help="JSON Lines, or a binary game database (OUTPUT plus OUTPUT.idx) that is appended to")
+    args = parser.parse_args(argv)
+
+    if "scripted" in (args.black, args.red) and not args.script:
+        parser.error("--script is required for scripted players")
+    if args.format == "binary" and args.output == "-":
+        parser.error("--format binary needs an --output file")
+    if not 4 <= args.board_size <= 26:
+        parser.error("--board-size must be from 4 to 26")
+    if args.format == "binary" and args.board_size != 9:
+        parser.error("--format binary only stores 9x9 games")
+
+    options = {"games": args.games, "workers": args.workers, "chunk_size": max(1, args.chunk_size),
+               "black": args.black, "red": args.red, "script": read_script(args.script) if args.script else [],
+               "engine_time_ms": args.engine_time_ms, "engine_depth": args.engine_depth,
+               "max_plies": args.max_plies, "seed": args.seed, "board_size": args.board_size}
+
+    if args.format == "binary":
+        with GameDatabaseWriter(args.output) as database:
+            summary = run(options, lambda records: append_records(database, records))
+    elif args.output == "-":
+        summary = run(options, lambda records: write_records(sys.stdout, records))
+    else:
+        with open(args.output, "w") as output:
+            summary = run(options, lambda records: write_records(output, records))
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+# Description: An asyncio server that hosts many Hasami Shogi games at once over TCP, plus a load generator for
+# measuring move latency. Run "python HasamiShogiServer.py serve --help" or "python HasamiShogiServer.py load --help".
+#
+# The protocol is one JSON object per line in each direction. Requests have an "op" and may carry an "id" that is
+# copied into the reply:
+#   {"op": "create", "color": "BOTH"}                  -> {"ok": true, "session": "17", ...}
+#   {"op": "join", "session": "17", "color": "RED"}    -> {"ok": true, ...}
+#   {"op": "move", "session": "17", "start": "i3", "end": "d3", "ply": 0}
+#   {"op": "state", "session": "17"}                   -> the state plus the board as nine strings
+#   {"op": "watch", "session": "17"} / {"op": "unwatch", "session": "17"}
+# Replies have "ok" and, when false, an "error". Spectators also get {"event": "move", ...} lines after every move
+# and {"event": "evicted", ...} when a game is dropped.
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+from HasamiShogiBoardGame import CompactHasamiShogiGame, HasamiShogiGame, _TABLES
+
+_COLORS = ("BLACK", "RED", "BOTH")
+
+# Spectators that fall this far behind are dropped rather than letting their unsent moves pile up in memory
+_SPECTATOR_BUFFER_LIMIT = 1 << 18
+
+
+class _Session:
+    """
+    This class is one hosted game: the game itself, the lock that makes each move one step, which connections may
+    move for each color and which connections are watching.
+    """
+
+    __slots__ = ("id", "game", "lock", "players", "spectators", "ply", "last_used")
+
+    def __init__(self, session_id):
+        """
+        This init method starts a new game with no players and no spectators.
+        """
+        self.id = session_id
+        self.game = CompactHasamiShogiGame()
+        self.lock = asyncio.Lock()
+        self.players = {"BLACK": None, "RED": None}
+        self.spectators = set()
+        self.ply = 0
+        self.last_used = time.monotonic()
+
+
+class HasamiShogiServer:
+    """
+    This class holds every game in one process, keyed by session id, and serves them to any number of connections.
+    At most MAX_SESSIONS games are kept: creating one more drops the game that was used least recently, and games
+    nobody has touched for IDLE_SECONDS are dropped by a background sweep.
+    """
+
+    def __init__(self, max_sessions=100000, idle_seconds=600.0):
+        """
+        This init method sets the limits on how many games are kept and for how long.
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self._max_sessions = max_sessions
+        self._idle_seconds = idle_seconds
+        self._sessions = OrderedDict()  # Least recently used first
+        self._ids = itertools.count(1)
+        self._server = None
+        self._sweeper = None
+        self._connections = {}  # Writer to the task serving it
+        self._stats = {"connections": 0, "requests": 0, "moves": 0, "created": 0, "evicted": 0}
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """
+        This method starts listening on HOST and PORT (0 picks a free port) and returns the port in use.
+        """
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        self._sweeper = asyncio.create_task(self._sweep_idle())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        """
+        This method keeps serving until the task is cancelled.
+        """
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """
+        This method stops listening, stops the idle sweep and closes every open connection.
+        """
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    def __len__(self):
+        """
+        This method returns how many games are being hosted.
+        """
+        return len(self._sessions)
+
+    def get_stats(self):
+        """
+        This method returns a dictionary of counters: connections, requests, moves, games created and evicted, and
+        the number of games hosted now.
+        """
+        stats = dict(self._stats)
+        stats["sessions"] = len(self._sessions)
+        return stats
+
+    async def _handle_connection(self, reader, writer):
+        """
+        This method serves one connection until it closes, answering each request line in order.
+        """
+        self._stats["connections"] += 1
+        self._connections[writer] = asyncio.current_task()
+        watching = set()
+        playing = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = self._handle_line(line, writer, watching, playing)
+                if not isinstance(reply, dict):
+                    reply = await reply
+                writer.write(_encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            # A connection that goes away gives up its colors and stops watching, but its games stay
+            for session_id in watching:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    session.spectators.discard(writer)
+            for session_id in playing:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    for color, owner in session.players.items():
+                        if owner is writer:
+                            session.players[color] = None
+            self._connections.pop(writer, None)
+            writer.close()
+
+    def _handle_line(self, line, writer, watching, playing):
+        """
+        This method decodes one request and returns its reply, or a coroutine giving the reply for a move.
+        """
+        self._stats["requests"] += 1
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "bad json"}
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "bad json"}
+
+        op = request.get("op")
+        if op == "move":
+            return self._guard(self._move(request, writer), request)
+
+        # Requests come off the network, so one that trips up an op gets an error reply instead of ending the
+        # connection
+        try:
+            if op == "create":
+                reply = self._create(request, writer, playing)
+            elif op == "join":
+                reply = self._join(request, writer, playing)
+            elif op == "state":
+                reply = self._state(request)
+            elif op == "watch":
+                reply = self._watch(request, writer, watching, True)
+            elif op == "unwatch":
+                reply = self._watch(request, writer, watching, False)
+            else:
+                reply = {"ok": False, "error": "unknown op"}
+        except Exception:
+            reply = {"ok": False, "error": "bad request"}
+        return _with_id(reply, request)
+
+    async def _guard(self, reply, request):
+        """
+        This method waits for the REPLY coroutine of a move and, like _handle_line, answers with an error reply if
+        the move raised.
+        """
+        try:
+            return await reply
+        except Exception:
+            return _with_id({"ok": False, "error": "bad request"}, request)
+
+    def _create(self, request, writer, playing):
+        """
+        This method starts a new game, giving this connection the requested color ("BOTH" by default). The least
+        recently used game is dropped first if the server is full.
+        """
+        color = request.get("color", "BOTH")
+        if color not in _COLORS:
+            return {"ok": False, "error": "bad color"}
+        while len(self._sessions) >= self._max_sessions:
+            self._evict(next(iter(self._sessions)))
+
+        session = _Session(str(next(self._ids)))
+        self._sessions[session.id] = session
+        self._stats["created"] += 1
+        self._claim(session, color, writer)
+        playing.add(session.id)
+        return _describe(session)
+
+    def _join(self, request, writer, playing):
+        """
+        This method gives this connection a color in an existing game if nobody else holds it.
+        """
+        session = self._lookup(request)
+        if session is None:
+            return {"ok": False, "error": "no such session"}
+        color = request.get("color")
+        if color not in _COLORS:
+            return {"ok": False, "error": "bad color"}
+        for taken in ("BLACK", "RED"):
+            if color in (taken, "BOTH") and session.players[taken] not in (None, writer):
+                return {"ok": False, "error": taken + " is taken"}
+        self._claim(session, color, writer)
+        playing.add(session.id)
+        return _describe(session)
+
+    def _state(self, request):
+        """
+        This method returns a game's state along with its board, one string of "B", "R" and "." per row.
+        """
+        session = self._lookup(request)
+        if session is None:
+            return {"ok": False, "error": "no such session"}
+        board = session.game.get_board()
+        size = _TABLES.size
+        reply = _describe(session)
+        reply["board"] = ["".join(board.get_square(row * size + column) for column in range(size))
+                          for row in range(size)]
+        return reply
+
+    def _watch(self, request, writer, watching, watch):
+        """
+        This method starts (WATCH True) or stops sending this connection a line for every move in a game.
+        """
+        session = self._lookup(request)
+        if session is None:
+            return {"ok": False, "error": "no such session"}
+        if watch:
+            session.spectators.add(writer)
+            watching.add(session.id)
+        else:
+            session.spectators.discard(writer)
+            watching.discard(session.id)
+        return _describe(session)
+
+    async def _move(self, request, writer):
+        """
+        This method makes a move for the connection. It must hold the color to move, and if the request has a "ply"
+        it must match the number of moves played so far, so two clients racing for one turn can't both move. The
+        turn check, the move and the broadcast happen under the game's lock as one step.
+        """
+        session = self._lookup(request)
+        if session is None:
+            return _with_id({"ok": False, "error": "no such session"}, request)
+
+        async with session.lock:
+            game = session.game
+            color = game.get_active_player()
+            if color is None:
+                return _with_id({"ok": False, "error": "game over"}, request)
+            if session.players[color] is not writer:
+                return _with_id({"ok": False, "error": "not your turn"}, request)
+            if request.get("ply", session.ply) != session.ply:
+                return _with_id({"ok": False, "error": "stale ply"}, request)
+
+            start = request.get("start")
+            end = request.get("end")
+            if not isinstance(start, str) or not isinstance(end, str) or not game.make_move(start, end):
+                return _with_id({"ok": False, "error": "illegal move"}, request)
+
+            session.ply += 1
+            self._stats["moves"] += 1
+            reply = _describe(session)
+            if session.spectators:
+                event = dict(reply, event="move", start=start, end=end)
+                del event["ok"]
+                self._broadcast(session, event)
+        return _with_id(reply, request)
+
+    def _broadcast(self, session, event):
+        """
+        This method sends EVENT to every spectator of SESSION without waiting on any of them. Spectators whose
+        unsent data has grown past the limit are dropped from the game.
+        """
+        data = _encode(event)
+        for spectator in list(session.spectators):
+            if spectator.is_closing() or spectator.transport.get_write_buffer_size() > _SPECTATOR_BUFFER_LIMIT:
+                session.spectators.discard(spectator)
+            else:
+                spectator.write(data)
+
+    def _lookup(self, request):
+        """
+        This method returns the game named by the request's "session" and marks it as just used, or None. Session
+        names are strings, so anything else names no game.
+        """
+        session_id = request.get("session")
+        if not isinstance(session_id, str):
+            return None
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+            self._sessions.move_to_end(session.id)
+        return session
+
+    def _claim(self, session, color, writer):
+        """
+        This method gives COLOR ("BLACK", "RED" or "BOTH") in SESSION to the connection WRITER.
+        """
+        for taken in ("BLACK", "RED"):
+            if color in (taken, "BOTH"):
+                session.players[taken] = writer
+
+    def _evict(self, session_id):
+        """
+        This method drops a game and tells its spectators.
+        """
+        session = self._sessions.pop(session_id)
+        self._stats["evicted"] += 1
+        if session.spectators:
+            self._broadcast(session, {"event": "evicted", "session": session.id})
+
+    async def _sweep_idle(self):
+        """
+        This method drops idle games every so often. Games are kept in order of last use, so it only has to look at
+        the front of the list until it finds one that is still active.
+        """
+        interval = min(max(self._idle_seconds / 4, 0.05), 30.0)
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - self._idle_seconds
+            while self._sessions:
+                session = next(iter(self._sessions.values()))
+                if session.last_used > cutoff:
+                    break
+                self._evict(session.id)
+
+
+def _describe(session):
+    """
+    This function returns the reply fields every op shares: the session, move count, state, turn and captures.
+    """
+    game = session.game
+    return {"ok": True, "session": session.id, "ply": session.ply, "state": game.get_game_state(),
+            "turn": game.get_active_player(), "red_captured": game.get_num_captured_pieces("RED"),
+            "black_captured": game.get_num_captured_pieces("BLACK")}
+
+
+def _with_id(reply, request):
+    """
+    This function copies the request's "id", if it has one, into the reply.
+    """
+    if "id" in request:
+        reply["id"] = request["id"]
+    return reply
+
+
+def _encode(message):
+    """
+    This function turns a message into one line of compact JSON.
+    """
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+async def _serve(options):
+    """
+    This function runs a server until it is interrupted.
+    """
+    server = HasamiShogiServer(options.max_sessions, options.idle_seconds)
+    port = await server.start(options.host, options.port)
+    print("listening on " + options.host + ":" + str(port), file=sys.stderr, flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+async def _load_connection(host, port, games, moves, seed, latencies, counts):
+    """
+    This function is one load-generator connection. It creates GAMES games and then makes a move in each of them in
+    turn, MOVES rounds over, so all of them stay live at once. Each request waits for its reply, and the time it took
+    goes in LATENCIES.
+    """
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    rng = random.Random(seed)
+    perf_counter = time.perf_counter
+
+    async def request(message):
+        writer.write(_encode(message))
+        sent = perf_counter()
+        line = await reader.readline()
+        return json.loads(line), perf_counter() - sent
+
+    local = []
+    for _ in range(games):
+        reply, _ = await request({"op": "create"})
+        local.append([reply["session"], HasamiShogiGame(bitboard=True)])
+
+    for _ in range(moves):
+        for entry in local:
+            session_id, game = entry
+            color = game.get_active_player()
+            if color is None:
+                continue
+            choices = list(game.legal_moves(color))
+            if not choices:
+                continue
+            start, end = rng.choice(choices)
+            reply, latency = await request({"op": "move", "session": session_id, "start": start, "end": end})
+            latencies.append(latency)
+            if reply["ok"]:
+                game.make_move(start, end)
+                counts["moves"] += 1
+            else:
+                counts["errors"] += 1
+
+    writer.close()
+    await writer.wait_closed()
+
+
+async def _load(options):
+    """
+    This function runs the load generator against a server and returns a summary with the p50 and p99 latency of
+    the move requests.
+    """
+    process = None
+    host, port = options.host, options.port
+    if options.spawn:
+        process = subprocess.Popen([sys.executable, __file__, "serve", "--host", host, "--port", str(port),
+                                    "--max-sessions", str(max(options.games, 1))], stderr=subprocess.PIPE)
+        process.stderr.readline()  # Waits for the "listening" line
+
+    try:
+        latencies = []
+        counts = {"moves": 0, "errors": 0}
+        connections = max(1, min(options.connections, options.games))
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            _load_connection(host, port, options.games // connections + (number < options.games % connections),
+                             options.moves, options.seed * 1000003 + number, latencies, counts)
+            for number in range(connections)])
+        elapsed = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    summary = {"games": options.games, "connections": connections, "moves": counts["moves"],
+               "errors": counts["errors"], "seconds": round(elapsed, 3),
+               "moves_per_second": round(counts["moves"] / elapsed, 1) if elapsed > 0 else 0.0}
+    for name, fraction in (("p50_ms", 0.50), ("p99_ms", 0.99), ("max_ms", 1.0)):
+        if latencies:
+            summary[name] = round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+        else:
+            summary[name] = None
+    return summary
+
+
+def main(argv=None):
+    """
+    This function is the command-line entry point, with a "serve" and a "load" command.
+    """
+    parser = argparse.ArgumentParser(description="Host Hasami Shogi games over TCP, or generate load against a host.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the game server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--max-sessions", type=int, default=100000, help="games kept before the oldest is dropped")
+    serve.add_argument("--idle-seconds", type=float, default=600.0, help="games unused this long are dropped")
+
+    load = commands.add_parser("load", help="play random games against a server and report move latency")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--games", type=int, default=10000, help="games kept live at once")
+    load.add_argument("--connections", type=int, default=100, help="client connections the games are spread over")
+    load.add_argument("--moves", type=int, default=20, help="moves made in every game")
+    load.add_argument("--seed", type=int, default=0)
+    load.add_argument("--spawn", action="store_true", help="start a server in a separate process for the run")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(_serve(args))
+        except KeyboardInterrupt:
+            pass
+    else:
+        print(json.dumps(asyncio.run(_load(args))))
+
+
+if __name__ == "__main__":
+    main()
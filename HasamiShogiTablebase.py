@@ -0,0 +1,315 @@
+# Description: An endgame tablebase for Hasami Shogi. It is built once by retrograde analysis and saved as a flat file
+# of one byte per position, which is memory-mapped so probing a position is one index calculation and one byte read.
+# Run "python HasamiShogiTablebase.py --help" to build one.
+#
+# A side wins as soon as the other side is down to one piece, so two pieces each is the smallest ending that is not
+# already decided. Every capture there wins on the spot, which is what makes the table possible to solve: the only
+# moves that keep the game going are quiet slides, and those can be walked backwards.
+
+import argparse
+import mmap
+import struct
+import sys
+import time
+
+from HasamiShogiBoardGame import _TABLES
+
+_MAGIC = b"HSGTBL01"
+_HEADER = struct.Struct("<8sBxH")  # Magic, board size, number of tables
+_TABLE = struct.Struct("<BBxxxxxxQQ")  # Mover's pieces, other side's pieces, data offset, entries
+
+# Each entry is the number of plies until the winning capture: odd when the side to move wins, even when it loses
+_DRAW = 0
+_INVALID = 255
+_MAX_DISTANCE = 254
+_OPPOSITE = (1, 0, 3, 2)  # Down, up, right, left: the reverse of each of the rays' directions
+
+_SQUARES = _TABLES.size * _TABLES.size
+_BOARD_PIECES = _TABLES.size  # Pieces each side starts with
+_BINOMIALS = [[1] + [0] * 8 for _ in range(_SQUARES + 1)]
+for _n in range(1, _SQUARES + 1):
+    for _k in range(1, 9):
+        _BINOMIALS[_n][_k] = _BINOMIALS[_n - 1][_k - 1] + _BINOMIALS[_n - 1][_k]
+
+
+def _rank(squares):
+    """
+    This function numbers a set of squares, given in increasing order, so every set of the same size gets a
+    different number from 0 up to (81 choose size) - 1.
+    """
+    rank = 0
+    for position, square in enumerate(squares):
+        rank += _BINOMIALS[square][position + 1]
+    return rank
+
+
+def _squares(mask):
+    """
+    This function lists the squares set in a mask in increasing order.
+    """
+    squares = []
+    while mask:
+        low = mask & -mask
+        mask ^= low
+        squares.append(low.bit_length() - 1)
+    return squares
+
+
+class HasamiShogiTablebase:
+    """
+    This class reads a tablebase file written by build_tablebase. Nothing is parsed but the small header; every
+    probe reads one byte straight out of the mapped file.
+    """
+
+    def __init__(self, path):
+        """
+        This init method maps the file at PATH.
+        """
+        self._file = open(path, "rb")
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, size, count = _HEADER.unpack_from(self._data, 0)
+        if magic != _MAGIC or size != _TABLES.size:
+            self.close()
+            raise ValueError(path + " is not a Hasami Shogi tablebase for this board")
+
+        # _tables[(mover pieces, other pieces)] is (data offset, entries per mover rank)
+        self._tables = {}
+        for number in range(count):
+            mover, other, offset, _ = _TABLE.unpack_from(self._data, _HEADER.size + number * _TABLE.size)
+            self._tables[(mover, other)] = (offset, _BINOMIALS[_SQUARES][other])
+
+    def __enter__(self):
+        """
+        This method lets the tablebase be used in a with statement.
+        """
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        This method unmaps and closes the file at the end of a with statement.
+        """
+        self.close()
+
+    def close(self):
+        """
+        This method unmaps and closes the file.
+        """
+        self._data.close()
+        self._file.close()
+
+    def get_signatures(self):
+        """
+        This method returns the (mover's pieces, other side's pieces) pairs the file has tables for.
+        """
+        return sorted(self._tables)
+
+    def probe(self, game):
+        """
+        This method looks up GAME's position and returns ("WIN", plies), ("LOSS", plies) or ("DRAW", None) for the
+        player to move, where plies counts the moves left until the winning capture with best play from both sides.
+        It returns None when the tablebase doesn't cover the position, the game is already over or GAME is on a
+        different size of board.
+        """
+        turn = game._player_turn
+        if turn is None or game._tables is not _TABLES:
+            return None
+        black, red = game._board.get_masks()
+        if turn == "BLACK":
+            mover, other = black, red
+            mover_captured, other_captured = game._player_black_captured, game._player_red_captured
+        else:
+            mover, other = red, black
+            mover_captured, other_captured = game._player_red_captured, game._player_black_captured
+
+        mover_squares = _squares(mover)
+        other_squares = _squares(other)
+        table = self._tables.get((len(mover_squares), len(other_squares)))
+
+        # The tables assume a side loses on reaching one piece, which only holds if the counters match the board
+        if table is None or mover_captured + len(mover_squares) != _BOARD_PIECES \
+                or other_captured + len(other_squares) != _BOARD_PIECES:
+            return None
+
+        offset, stride = table
+        value = self._data[offset + _rank(mover_squares) * stride + _rank(other_squares)]
+        if value == _DRAW:
+            return "DRAW", None
+        if value == _INVALID:
+            return None
+        return ("WIN" if value & 1 else "LOSS"), value
+
+
+def build_tablebase(path, report=None):
+    """
+    This function solves every position with two pieces for each side and writes the tablebase to PATH. REPORT, if
+    given, is called with a line of progress text now and then. It needs NumPy and takes about half a minute.
+    """
+    import numpy as np  # Only building needs NumPy; probing works without it
+
+    started = time.perf_counter()
+    values = _solve_two_against_two(np, report, started)
+
+    with open(path, "wb") as output:
+        output.write(_HEADER.pack(_MAGIC, _TABLES.size, 1))
+        offset = _HEADER.size + _TABLE.size
+        output.write(_TABLE.pack(2, 2, offset, len(values)))
+        output.write(values.tobytes())
+
+    counts = np.bincount(values, minlength=256)
+    summary = {"positions": int(len(values) - counts[_INVALID]), "wins": int(counts[1:_INVALID:2].sum()),
+               "losses": int(counts[2:_INVALID:2].sum()), "draws": int(counts[_DRAW]),
+               "longest": int(np.nonzero(counts[:_INVALID])[0].max()),
+               "seconds": round(time.perf_counter() - started, 1)}
+    return summary
+
+
+def _solve_two_against_two(np, report, started):
+    """
+    This function runs the retrograde analysis and returns one byte per position, indexed by the rank of the mover's
+    two squares times (81 choose 2) plus the rank of the other side's two squares. Index pairs that put two pieces
+    on one square are marked invalid.
+
+    Positions with a capture available are wins in one ply. From there the analysis works backwards one ply at a
+    time: anything that can move into a lost position is won, and a position is lost once every one of its moves has
+    been found to lead to a won position. Whatever is never reached is a draw, since neither side can force a capture.
+    """
+    size = _TABLES.size
+    off_board = _SQUARES  # Padding square that is never occupied
+    pairs = np.array([(low, high) for high in range(_SQUARES) for low in range(high)], dtype=np.int16)
+    count = len(pairs)
+    entries = count * count
+    chunk = 1 << 18
+
+    # rays[square, direction] is the squares walked outwards from SQUARE, then padding; the padding square's rays are
+    # all padding so a ray can be followed from any square it reaches
+    rays = np.full((_SQUARES + 1, 4, size), off_board, dtype=np.int16)
+    for square in range(_SQUARES):
+        for direction, ray in enumerate(_TABLES.rays[square]):
+            rays[square, direction, :len(ray)] = ray
+
+    # on_path[start, end, square] is true when SQUARE has to be empty to slide from START to END
+    aligned = np.zeros((_SQUARES + 1, _SQUARES + 1), dtype=bool)
+    on_path = np.zeros((_SQUARES + 1, _SQUARES + 1, _SQUARES + 1), dtype=bool)
+    for start in range(_SQUARES):
+        for ray in _TABLES.rays[start]:
+            for distance, end in enumerate(ray):
+                aligned[start, end] = True
+                on_path[start, end, list(ray[:distance + 1])] = True
+
+    def progress(text):
+        if report is not None:
+            report("%7.1fs  %s" % (time.perf_counter() - started, text))
+
+    def decode(indexes):
+        mover = pairs[indexes // count]
+        other = pairs[indexes % count]
+        return mover[:, 0], mover[:, 1], other[:, 0], other[:, 1]
+
+    def slides(piece, blockers):
+        """
+        This function returns the rays out of each PIECE and how many empty squares each one has before the first
+        of the BLOCKERS or the edge.
+        """
+        ray = rays[piece]
+        blocked = ray == off_board
+        for blocker in blockers:
+            blocked |= ray == blocker[:, None, None]
+        return ray, blocked.argmax(axis=2)
+
+    values = np.zeros(entries, dtype=np.uint8)
+    degrees = np.zeros(entries, dtype=np.uint8)
+
+    # Counts every position's moves and marks the ones with a capture as wins in one
+    for first in range(0, entries, chunk):
+        indexes = np.arange(first, min(first + chunk, entries))
+        own_first, own_second, enemy_first, enemy_second = decode(indexes)
+        valid = (own_first != enemy_first) & (own_first != enemy_second) \
+            & (own_second != enemy_first) & (own_second != enemy_second)
+        degree = np.zeros(len(indexes), dtype=np.int32)
+        capture = np.zeros(len(indexes), dtype=bool)
+
+        # A capture needs the moving piece to land beside an enemy piece, so only those landing squares are tried
+        for piece, partner in ((own_first, own_second), (own_second, own_first)):
+            _, free = slides(piece, (partner, enemy_first, enemy_second))
+            degree += free.sum(axis=1)
+
+            def reaches(end):
+                return aligned[piece, end] & ~on_path[piece, end, partner] & ~on_path[piece, end, enemy_first] \
+                    & ~on_path[piece, end, enemy_second]
+
+            # The run is closed off by PARTNER, either straight after the enemy piece or after both enemy pieces
+            for enemy, other_enemy in ((enemy_first, enemy_second), (enemy_second, enemy_first)):
+                for direction in range(4):
+                    beyond = rays[enemy, direction]
+                    closed = (beyond[:, 0] == partner) | (beyond[:, 0] == other_enemy) & (beyond[:, 1] == partner)
+                    capture |= closed & reaches(rays[enemy, _OPPOSITE[direction], 0])
+
+            for end, (corner_bit, partner_bit) in _TABLES.corners.items():
+                corner = corner_bit.bit_length() - 1
+                capture |= ((enemy_first == corner) | (enemy_second == corner)) \
+                    & (partner == partner_bit.bit_length() - 1) & reaches(end)
+
+        block = values[first:first + len(indexes)]
+        block[capture] = 1
+        block[~valid] = _INVALID
+        degrees[first:first + len(indexes)] = degree
+    progress("%d positions scored, %d wins in one" % (entries, int((values == 1).sum())))
+
+    # Walks backwards one ply at a time from the positions decided at DISTANCE
+    distance = 1
+    frontier = np.nonzero(values == 1)[0]
+    while len(frontier):
+        if distance + 1 > _MAX_DISTANCE:
+            raise RuntimeError("a distance does not fit in one byte")
+        found = []
+        for first in range(0, len(frontier), chunk):
+            indexes = frontier[first:first + chunk]
+            own_first, own_second, enemy_first, enemy_second = decode(indexes)
+            mover_rank = (indexes // count)[:, None]
+            previous = []
+
+            # The other side just moved one of its pieces here from some square along an empty line
+            for piece, partner in ((enemy_first, enemy_second), (enemy_second, enemy_first)):
+                ray, free = slides(piece, (partner, own_first, own_second))
+                partner = partner[:, None].astype(np.int64)
+                for step in range(size - 1):
+                    origin = ray[:, :, step].astype(np.int64)
+                    reached = step < free
+                    if not reached.any():
+                        break
+                    low = np.minimum(origin, partner)
+                    high = np.maximum(origin, partner)
+                    previous.append(((low + high * (high - 1) // 2) * count + mover_rank)[reached])
+
+            previous = np.concatenate(previous)
+            previous = previous[values[previous] == 0]
+            if distance & 1:
+                # A move into a won position for the opponent is one fewer way out for the mover
+                np.subtract.at(degrees, previous, 1)
+                previous = np.unique(previous[degrees[previous] == 0])
+            else:
+                previous = np.unique(previous)
+            values[previous] = distance + 1
+            found.append(previous)
+
+        frontier = np.concatenate(found)
+        distance += 1
+        progress("distance %d: %d positions" % (distance, len(frontier)))
+    return values
+
+
+def main(argv=None):
+    """
+    This function is the command-line entry point.
+    """
+    parser = argparse.ArgumentParser(description="Build the two-against-two Hasami Shogi endgame tablebase.")
+    parser.add_argument("--output", default="HasamiShogi2v2.tb", help="file to write")
+    parser.add_argument("--quiet", action="store_true", help="don't print progress")
+    args = parser.parse_args(argv)
+
+    report = None if args.quiet else (lambda text: print(text, file=sys.stderr, flush=True))
+    print(build_tablebase(args.output, report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Description: A batched Hasami Shogi environment for training. It keeps many games in one NumPy array and plays one
+# move in every game per step with array operations, following the same rules as HasamiShogiGame.make_move.
+
+import numpy as np
+
+from HasamiShogiBoardGame import HasamiShogiGame, _TABLES, _build_position
+
+EMPTY = 0
+BLACK = 1
+RED = -1
+
+_SIZE = _TABLES.size
+_SQUARES = _SIZE * _SIZE
+_OFF_BOARD = _SQUARES  # Index of an always-empty padding square used to fill the tables below
+_STEPS = np.arange(_SIZE)
+
+
+def _build_tables():
+    """
+    This function turns the board tables into NumPy arrays: whether two squares share a line, which squares a slide
+    passes over, the four rays leaving each square (padded with the off-board square) and the corner captures.
+    """
+    aligned = np.zeros((_SQUARES, _SQUARES), dtype=bool)
+    between = np.zeros((_SQUARES, _SQUARES, _SQUARES), dtype=bool)
+
+    # Rays are one square shorter than the board, so every ray row ends in at least one padding square
+    rays = np.full((_SQUARES, 4, _SIZE), _OFF_BOARD, dtype=np.intp)
+    for start in range(_SQUARES):
+        for direction, ray in enumerate(_TABLES.rays[start]):
+            rays[start, direction, :len(ray)] = ray
+            for distance, end in enumerate(ray):
+                aligned[start, end] = True
+                between[start, end, list(ray[:distance + 1])] = True
+
+    corners = np.full(_SQUARES, _OFF_BOARD, dtype=np.intp)
+    partners = np.full(_SQUARES, _OFF_BOARD, dtype=np.intp)
+    for end, (corner_bit, partner_bit) in _TABLES.corners.items():
+        corners[end] = corner_bit.bit_length() - 1
+        partners[end] = partner_bit.bit_length() - 1
+    return aligned, between, rays, corners, partners
+
+
+_ALIGNED, _BETWEEN, _RAYS, _CORNERS, _PARTNERS = _build_tables()
+
+
+class HasamiShogiVectorEnv:
+    """
+    This class runs NUM_GAMES games side by side. The boards are one (NUM_GAMES, 9, 9) int8 array holding BLACK (1),
+    RED (-1) or EMPTY (0), and every step takes one move per game as square indices (row * 9 + column, counting from
+    zero). The Python work per step is the same no matter how many games there are.
+    """
+
+    def __init__(self, num_games):
+        """
+        This init method sets up NUM_GAMES games in the starting position with Black to move.
+        """
+        self._boards = np.zeros((num_games, _SIZE, _SIZE), dtype=np.int8)
+        self._turns = np.zeros(num_games, dtype=np.int8)
+        self._red_captured = np.zeros(num_games, dtype=np.int16)
+        self._black_captured = np.zeros(num_games, dtype=np.int16)
+        self._winners = np.zeros(num_games, dtype=np.int8)
+        self.reset()
+
+    def __len__(self):
+        """
+        This method returns the number of games.
+        """
+        return len(self._boards)
+
+    def reset(self, games=None):
+        """
+        This method puts the GAMES (an index array or boolean mask, every game by default) back to the starting
+        position.
+        """
+        if games is None:
+            games = slice(None)
+        self._boards[games] = EMPTY
+        self._boards[games, 0, :] = RED
+        self._boards[games, _SIZE - 1, :] = BLACK
+        self._turns[games] = BLACK
+        self._red_captured[games] = 0
+        self._black_captured[games] = 0
+        self._winners[games] = 0
+
+    def get_boards(self):
+        """
+        This method returns the (num_games, 9, 9) board array itself, not a copy, so it should only be read.
+        """
+        return self._boards
+
+    def get_active_players(self):
+        """
+        This method returns each game's player to move: BLACK, RED, or 0 once the game is over.
+        """
+        return self._turns
+
+    def get_game_states(self):
+        """
+        This method returns each game's winner: BLACK, RED, or 0 while it is unfinished.
+        """
+        return self._winners
+
+    def get_num_captured_pieces(self, color):
+        """
+        This method returns how many of COLOR's pieces ("BLACK" or "RED") have been captured in each game.
+        """
+        if color == "BLACK":
+            return self._black_captured
+        elif color == "RED":
+            return self._red_captured
+
+    def step(self, starts, ends):
+        """
+        This method plays the move STARTS[i] -> ENDS[i] in game i for every game at once. A move is refused, leaving
+        that game untouched, in exactly the cases make_move would return False: a finished game, a square off the
+        board, squares not on one line, a blocked path or not the mover's own piece. It returns a boolean array of
+        which moves were made and an array of how many pieces each move captured.
+        """
+        starts = np.asarray(starts, dtype=np.intp)
+        ends = np.asarray(ends, dtype=np.intp)
+        count = len(self._boards)
+        flat = self._boards.reshape(count, _SQUARES)
+        captured = np.zeros(count, dtype=np.int16)
+
+        on_board = (starts >= 0) & (starts < _SQUARES) & (ends >= 0) & (ends < _SQUARES)
+        start_index = np.where(on_board, starts, 0)
+        end_index = np.where(on_board, ends, 0)
+        games = np.arange(count)
+
+        accepted = on_board & (self._winners == 0) & _ALIGNED[start_index, end_index] \
+            & (flat[games, start_index] == self._turns)
+        accepted &= ~np.any(_BETWEEN[start_index, end_index] & (flat != EMPTY), axis=1)
+
+        moved = np.nonzero(accepted)[0]
+        if not len(moved):
+            return accepted, captured
+
+        start_index = start_index[moved]
+        end_index = end_index[moved]
+        own = self._turns[moved]
+        rows = np.arange(len(moved))
+
+        # Works on a copy of the moving games with the always-empty padding square on the end
+        padded = np.zeros((len(moved), _SQUARES + 1), dtype=np.int8)
+        padded[:, :_SQUARES] = flat[moved]
+        padded[rows, start_index] = EMPTY
+        padded[rows, end_index] = own
+
+        # Every direction at once: a run of enemy pieces leaving the landing square, closed by one of the mover's.
+        # The run ends at the first square that isn't an enemy piece, which the padding square guarantees exists.
+        squares = _RAYS[end_index] + (rows * (_SQUARES + 1))[:, None, None]
+        values = np.take(padded.ravel(), squares)
+        lengths = (values != -own[:, None, None]).argmax(axis=2)
+        closing = np.take_along_axis(values, lengths[:, :, None], axis=2)[:, :, 0]
+        lengths[closing != own[:, None]] = 0
+        run = _STEPS < lengths[:, :, None]
+        padded.ravel()[squares[run]] = EMPTY
+        taken = lengths.sum(axis=1)
+
+        # Corner capture checks
+        corners = _CORNERS[end_index]
+        corner_taken = (corners != _OFF_BOARD) & (padded[rows, corners] == -own) \
+            & (padded[rows, _PARTNERS[end_index]] == own)
+        padded[rows, np.where(corner_taken, corners, _OFF_BOARD)] = EMPTY
+        taken += corner_taken
+
+        flat[moved] = padded[:, :_SQUARES]
+        captured[moved] = taken
+
+        black_moved = own == BLACK
+        self._red_captured[moved] += np.where(black_moved, taken, 0).astype(np.int16)
+        self._black_captured[moved] += np.where(black_moved, 0, taken).astype(np.int16)
+        self._turns[moved] = -own
+
+        black_won = moved[black_moved & (self._red_captured[moved] >= _TABLES.win_captures)]
+        red_won = moved[~black_moved & (self._black_captured[moved] >= _TABLES.win_captures)]
+        self._winners[black_won] = BLACK
+        self._winners[red_won] = RED
+        self._turns[black_won] = 0
+        self._turns[red_won] = 0
+        return accepted, captured
+
+    def to_game(self, index):
+        """
+        This method returns a HasamiShogiGame in the same position as game INDEX, for printing or checking moves.
+        """
+        game = HasamiShogiGame()
+        flat = self._boards[index].reshape(_SQUARES)
+        black = 0
+        red = 0
+        for square in np.nonzero(flat == BLACK)[0]:
+            black |= 1 << int(square)
+        for square in np.nonzero(flat == RED)[0]:
+            red |= 1 << int(square)
+        turn = {BLACK: "BLACK", RED: "RED", 0: None}[int(self._turns[index])]
+        winner = {BLACK: "BLACK_WON", RED: "RED_WON", 0: "UNFINISHED"}[int(self._winners[index])]
+        game._set_position(_build_position(black, red, turn, int(self._red_captured[index]),
+                                           int(self._black_captured[index]), winner))
+        return game